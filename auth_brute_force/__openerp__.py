@@ -20,6 +20,7 @@
     'data': [
         'security/ir_model_access.yml',
         'views/data.xml',
+        'views/ir_cron.xml',
         'views/view.xml',
         'views/action.xml',
         'views/menu.xml',
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Login load test, not loaded by the addon. See login_benchmark.py"""
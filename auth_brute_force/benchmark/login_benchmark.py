@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Load test of the login path of a running server.
+
+Concurrent XML-RPC or JSON logins are fired at a local server in three
+scenarios, and p50/p99 latency is reported for each of them:
+
+* ``good``: right password.
+* ``bad``: wrong password, each attempt from a different remote.
+* ``banned``: wrong password from a remote that was banned beforehand.
+
+Remotes are faked with ``X-Forwarded-For`` and ``X-Forwarded-Host``. The
+server must run with ``--proxy-mode``, and Odoo only applies the forwarded
+remote when ``X-Forwarded-Host`` is present. Without proxy mode every attempt
+comes from 127.0.0.1, so the ``bad`` and ``banned`` scenarios ban localhost
+and spoil every scenario run after them.
+
+If a PostgreSQL DSN is given, the statements (with the
+``pg_stat_statements`` extension) or else the transactions run per attempt
+are reported too.
+
+Run it against a server started with ``--proxy-mode``, on a database with
+the addon installed and another one without it to compare::
+
+    python login_benchmark.py --url http://localhost:8069 \\
+        --db with_addon --db without_addon --password admin \\
+        --attempts 2000 --concurrency 50 --dsn "dbname=postgres"
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xmlrpc.client as xmlrpclib
+    from urllib.parse import urlparse
+    from urllib.request import Request, urlopen
+except ImportError:  # Python 2
+    import xmlrpclib
+    from urllib2 import Request, urlopen
+    from urlparse import urlparse
+
+SCENARIOS = ("good", "bad", "banned")
+BANNED_REMOTE = "10.255.255.254"
+
+
+def forwarded_headers(url, remote):
+    """Headers faking the remote, honored by servers in proxy mode.
+
+    Odoo only applies ``X-Forwarded-For`` when ``X-Forwarded-Host`` is sent.
+    """
+    return {
+        "X-Forwarded-For": remote,
+        "X-Forwarded-Host": urlparse(url).netloc,
+    }
+
+
+class ForwardedTransport(xmlrpclib.Transport):
+    """XML-RPC transport faking the remote with forwarded headers."""
+
+    def __init__(self, url, remote):
+        xmlrpclib.Transport.__init__(self)
+        self.headers = forwarded_headers(url, remote)
+
+    def send_headers(self, connection, headers):
+        for name, value in sorted(self.headers.items()):
+            connection.putheader(name, value)
+        xmlrpclib.Transport.send_headers(self, connection, headers)
+
+
+def fake_remote(index):
+    """Get a different private IPv4 for every index."""
+    return "10.%d.%d.%d" % (
+        (index >> 16) & 255, (index >> 8) & 255, index & 255 or 1)
+
+
+def login_xmlrpc(url, db, login, password, remote):
+    proxy = xmlrpclib.ServerProxy(
+        url + "/xmlrpc/2/common", transport=ForwardedTransport(url, remote))
+    return bool(proxy.login(db, login, password))
+
+
+def login_json(url, db, login, password, remote):
+    request = Request(
+        url + "/web/session/authenticate",
+        data=json.dumps({
+            "jsonrpc": "2.0",
+            "method": "call",
+            "params": {"db": db, "login": login, "password": password},
+        }).encode("utf-8"),
+        headers=dict(forwarded_headers(url, remote),
+                     **{"Content-Type": "application/json"}),
+    )
+    response = json.loads(urlopen(request, timeout=60).read().decode("utf-8"))
+    return bool(response.get("result", {}).get("uid"))
+
+
+LOGIN_METHODS = {
+    "xmlrpc": login_xmlrpc,
+    "json": login_json,
+}
+
+
+class QueryCounter(object):
+    """Count statements, or transactions, run by a PostgreSQL database."""
+
+    def __init__(self, dsn, db):
+        import psycopg2
+        self.connection = psycopg2.connect(dsn)
+        self.connection.autocommit = True
+        self.db = db
+        with self.connection.cursor() as cr:
+            cr.execute("SELECT 1 FROM pg_extension "
+                       "WHERE extname = 'pg_stat_statements'")
+            self.unit = "queries" if cr.fetchone() else "transactions"
+
+    def read(self):
+        with self.connection.cursor() as cr:
+            if self.unit == "queries":
+                cr.execute("""
+                    SELECT COALESCE(SUM(calls), 0)
+                    FROM pg_stat_statements
+                    JOIN pg_database ON pg_database.oid = dbid
+                    WHERE datname = %s
+                """, (self.db,))
+            else:
+                # Statistics are sent to the collector with some delay
+                time.sleep(1)
+                cr.execute("SELECT pg_stat_clear_snapshot()")
+                cr.execute("""
+                    SELECT xact_commit + xact_rollback
+                    FROM pg_stat_database
+                    WHERE datname = %s
+                """, (self.db,))
+            return cr.fetchone()[0]
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * ratio), len(values) - 1)]
+
+
+def run_scenario(args, db, scenario, counter=None):
+    """Fire the logins of a scenario and measure them.
+
+    :return dict:
+        Latencies and query counts of the scenario.
+    """
+    login_method = LOGIN_METHODS[args.protocol]
+    if scenario == "good":
+        password = args.password
+    else:
+        password = args.password + "-wrong"
+    if scenario == "banned":
+        # Make sure the remote is banned before measuring
+        for n in range(args.ban_limit):
+            login_method(args.url, db, args.login, password, BANNED_REMOTE)
+    latencies = []
+    successes = []
+    lock = threading.Lock()
+
+    def attempt(index):
+        remote = BANNED_REMOTE if scenario == "banned" else fake_remote(
+            index + (SCENARIOS.index(scenario) << 20))
+        start = time.time()
+        try:
+            ok = login_method(args.url, db, args.login, password, remote)
+        except Exception:
+            ok = None
+        elapsed = time.time() - start
+        with lock:
+            latencies.append(elapsed)
+            successes.append(ok)
+
+    queries = counter.read() if counter else None
+    start = time.time()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    list(pool.map(attempt, range(args.attempts)))
+    pool.shutdown()
+    elapsed = time.time() - start
+    if counter:
+        queries = (counter.read() - queries) / float(args.attempts)
+    return {
+        "db": db,
+        "scenario": scenario,
+        "attempts": args.attempts,
+        "successes": successes.count(True),
+        "errors": successes.count(None),
+        "attempts_second": args.attempts / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "queries_attempt": queries,
+        "unit": counter.unit if counter else None,
+    }
+
+
+def print_results(results):
+    print("%-20s %-8s %8s %8s %7s %10s %9s %9s %12s" % (
+        "db", "scenario", "attempts", "success", "errors", "attempts/s",
+        "p50 (ms)", "p99 (ms)", "db work/att"))
+    for result in results:
+        db_work = "-"
+        if result["queries_attempt"] is not None:
+            db_work = "%.1f %s" % (result["queries_attempt"],
+                                   result["unit"][0])
+        print("%-20s %-8s %8d %8d %7d %10.1f %9.1f %9.1f %12s" % (
+            result["db"], result["scenario"], result["attempts"],
+            result["successes"], result["errors"],
+            result["attempts_second"], result["p50_ms"], result["p99_ms"],
+            db_work))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login load test")
+    parser.add_argument("--url", default="http://localhost:8069")
+    parser.add_argument("--db", action="append", required=True,
+                        help="Database to test, can be repeated")
+    parser.add_argument("--login", default="admin")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--protocol", choices=sorted(LOGIN_METHODS),
+                        default="xmlrpc")
+    parser.add_argument("--attempts", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenario to run, can be repeated (default all)")
+    parser.add_argument("--ban-limit", type=int, default=50,
+                        help="Failures needed to ban a remote "
+                             "(auth_brute_force.max_by_ip)")
+    parser.add_argument("--dsn",
+                        help="PostgreSQL DSN to count queries per attempt")
+    args = parser.parse_args()
+    results = []
+    for db in args.db:
+        counter = QueryCounter(args.dsn, db) if args.dsn else None
+        for scenario in args.scenario or SCENARIOS:
+            results.append(run_scenario(args, db, scenario, counter))
+    print_results(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
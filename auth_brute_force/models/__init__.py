@@ -1,4 +1,7 @@
 # -*- encoding: utf-8 -*-
 
+from . import res_authentication_alert
 from . import res_authentication_attempt
+from . import res_authentication_geolocation
+from . import res_authentication_remote_summary
 from . import res_users
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import COMMASPACE
+
+_logger = logging.getLogger(__name__)
+
+
+class AlertMailer(object):
+    """Send failed login alert digests over reused SMTP connections.
+
+    Alerts are stored in ``res.authentication.alert`` and sent by cron, so
+    they survive worker restarts. One connection per mail server is kept
+    open between runs, until it has been idle for ``idle_timeout`` seconds.
+    """
+
+    def __init__(self, idle_timeout=300):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # Mail config -> [connection, last use time]
+        self._connections = {}
+
+    def send_digest(self, config, subject, header, bodies):
+        """Send one mail with all the alert bodies.
+
+        :param tuple config:
+            ``(server, port, from, password, to)`` of the mail to send, where
+            ``to`` is a tuple of addresses.
+
+        :return bool:
+            Whether the mail was sent.
+        """
+        with self._lock:
+            return self._send_digest(config, subject, header, bodies)
+
+    def close_idle(self, now=None):
+        """Close the connections idle for ``idle_timeout`` seconds."""
+        with self._lock:
+            self._close_idle(time.time() if now is None else now)
+
+    def _send_digest(self, config, subject, header, bodies):
+        server, port, email_from, password, email_to = config
+        if len(bodies) > 1:
+            subject = "%s (%d attempts)" % (subject, len(bodies))
+        message = MIMEMultipart()
+        message['Subject'] = subject
+        message['From'] = email_from
+        message['To'] = COMMASPACE.join(email_to)
+        message.attach(MIMEText(header + "<hr/>".join(bodies), 'html',
+                                'utf-8'))
+        for retry in (False, True):
+            try:
+                conn = self._connection(config, reconnect=retry)
+                conn.sendmail(email_from, list(email_to), message.as_string())
+                return True
+            except (smtplib.SMTPServerDisconnected, IOError):
+                if retry:
+                    _logger.exception("Couldn't send alert to %s", email_to)
+            except Exception:
+                _logger.exception("Couldn't send alert to %s", email_to)
+                return False
+        return False
+
+    def _connection(self, config, reconnect=False):
+        entry = self._connections.get(config)
+        if entry is not None and reconnect:
+            self._close(config)
+            entry = None
+        if entry is None:
+            server, port, email_from, password, _email_to = config
+            conn = smtplib.SMTP_SSL(server, int(port))
+            conn.login(email_from, password)
+            entry = self._connections[config] = [conn, None]
+        entry[1] = time.time()
+        return entry[0]
+
+    def _close(self, config):
+        conn = self._connections.pop(config)[0]
+        try:
+            conn.quit()
+        except Exception:
+            pass  # Already dropped by the server
+
+    def _close_idle(self, now):
+        for config, entry in list(self._connections.items()):
+            if now - entry[1] >= self.idle_timeout:
+                self._close(config)
+
+
+alert_mailer = AlertMailer()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import threading
+from collections import OrderedDict, deque
+
+
+class BanCounter(object):
+    """Per-worker sliding window of recent authentication failures.
+
+    Entries are keyed by ``(dbname, remote, login)``, where ``login`` is
+    ``None`` for the remote-wide counter. Each entry keeps at most ``limit``
+    failure timestamps since the last success, which is all a ban decision
+    needs. Entries are loaded from the database the first time they are
+    needed and again after ``ttl`` seconds, so failures recorded by other
+    workers are seen at most ``ttl`` seconds late.
+
+    Expired entries are purged as they are met, and at most ``max_entries``
+    are kept, dropping the least recently used ones, so memory stays bounded
+    even when every attempt comes from a different remote or login.
+
+    Attempts still checking their credentials are counted as failures from
+    :meth:`begin` to :meth:`end`, so concurrent attempts of this worker
+    cannot all pass the ban check before the first one is recorded.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # Key -> (load time, failure times), least recently used first
+        self._entries = OrderedDict()
+        # Last TTL asked for, to purge expired entries when recording
+        self._ttl = 60
+        # Key -> amount of attempts between begin() and end()
+        self._pending = {}
+
+    def failures(self, key, now, window=0, ttl=60):
+        """Count the cached failures of a key.
+
+        :param tuple key:
+            ``(dbname, remote, login)`` key of the counter.
+
+        :param float now:
+            Current UNIX time.
+
+        :param int window:
+            Only failures newer than these seconds count. ``0`` counts every
+            failure since the last success.
+
+        :param int ttl:
+            Seconds after which an entry must be loaded again.
+
+        :return int:
+            Amount of failures, pending attempts included, or ``None`` if the
+            entry must be loaded from the database.
+        """
+        with self._lock:
+            self._ttl = ttl
+            self._purge(now)
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > ttl:
+                return None
+            self._touch(key)
+            times = entry[1]
+            if window:
+                while times and times[0] <= now - window:
+                    times.popleft()
+            return len(times) + self._pending.get(key, 0)
+
+    def load(self, key, times, now, limit):
+        """Store the failures read from the database for a key.
+
+        :param list times:
+            UNIX times of the most recent failures, in any order.
+
+        :return int:
+            Amount of failures stored, plus the pending attempts.
+        """
+        with self._lock:
+            self._entries[key] = (now, deque(sorted(times), maxlen=max(limit, 1)))
+            self._touch(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return len(self._entries[key][1]) + self._pending.get(key, 0)
+
+    def begin(self, dbname, remote, login):
+        """Count an attempt as failed until :meth:`end` is called."""
+        with self._lock:
+            for key in ((dbname, remote, None), (dbname, remote, login)):
+                self._pending[key] = self._pending.get(key, 0) + 1
+
+    def end(self, dbname, remote, login):
+        """Stop counting an attempt started with :meth:`begin`.
+
+        Call it once the attempt is recorded, or could not be.
+        """
+        with self._lock:
+            for key in ((dbname, remote, None), (dbname, remote, login)):
+                pending = self._pending.get(key, 0) - 1
+                if pending > 0:
+                    self._pending[key] = pending
+                else:
+                    self._pending.pop(key, None)
+
+    def record(self, dbname, remote, login, result, now):
+        """Update the cached counters of a committed authentication attempt."""
+        with self._lock:
+            self._purge(now)
+            for key in ((dbname, remote, None), (dbname, remote, login)):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue  # Loaded from the database when needed
+                if result == "successful":
+                    entry[1].clear()
+                else:
+                    entry[1].append(now)
+
+    def _touch(self, key):
+        """Mark an entry as the most recently used one."""
+        if hasattr(self._entries, "move_to_end"):
+            self._entries.move_to_end(key)
+        else:  # Python 2
+            self._entries[key] = self._entries.pop(key)
+
+    def _purge(self, now):
+        """Drop expired entries among the least recently used ones.
+
+        Entries in use are moved to the end, so this stops at the first
+        entry that has not expired, without scanning all of them.
+        """
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry[0] <= self._ttl:
+                break
+            del self._entries[key]
+
+    def clear(self, dbname=None):
+        """Forget cached counters, of one database or of all of them."""
+        with self._lock:
+            if dbname is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == dbname]:
+                del self._entries[key]
+
+
+ban_counter = BanCounter()
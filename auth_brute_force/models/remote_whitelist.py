@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import ipaddress
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class RemoteWhitelist(object):
+    """Whitelist of IPs and CIDR blocks, both IPv4 and IPv6.
+
+    Networks are stored as sets of prefixes, one set for each prefix length
+    in use, so checking a remote costs one set lookup per distinct prefix
+    length, no matter how many networks are listed.
+    """
+
+    def __init__(self, entries):
+        # (version, prefix length) -> set of network prefixes as integers
+        self._prefixes = {}
+        # Entries that are not IPs, like hostnames, matched literally
+        self._names = set()
+        for entry in entries:
+            entry = entry.strip()
+            if not entry:
+                continue
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                _logger.warning(
+                    "Whitelisted remote %r is not an IP or network", entry)
+                self._names.add(entry)
+                continue
+            shift = network.max_prefixlen - network.prefixlen
+            self._prefixes.setdefault(
+                (network.version, network.prefixlen, shift), set()).add(
+                int(network.network_address) >> shift)
+        # Longest prefixes first, as single IPs are the most common
+        self._lookups = sorted(self._prefixes.items(), reverse=True,
+                               key=lambda item: item[0][1])
+
+    def __contains__(self, remote):
+        if not remote:
+            return False
+        if remote in self._names:
+            return True
+        try:
+            address = ipaddress.ip_address(remote)
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        value = int(address)
+        for (version, _prefixlen, shift), prefixes in self._lookups:
+            if version == address.version and value >> shift in prefixes:
+                return True
+        return False
+
+
+_lock = threading.Lock()
+# Database name -> (raw parameter value, compiled whitelist)
+_compiled = {}
+
+
+def get_whitelist(dbname, raw):
+    """Get the compiled whitelist of a database.
+
+    It is compiled again only when the parameter value changes.
+
+    :param str raw:
+        Comma-separated IPs and networks, as stored in the parameter.
+    """
+    raw = raw or ""
+    cached = _compiled.get(dbname)
+    if cached is not None and cached[0] == raw:
+        return cached[1]
+    whitelist = RemoteWhitelist(raw.split(","))
+    with _lock:
+        _compiled[dbname] = (raw, whitelist)
+    return whitelist
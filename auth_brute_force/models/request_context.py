@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Request metadata shared by the authentication methods.
+
+Values are local to the request being served and are reset when it ends,
+so they never bleed into the next request served by the same worker.
+
+The storage depends on the worker type. Evented workers run requests in
+greenlets of one thread, and the greenlet version they ship does not give
+each greenlet its own context variables, so ``gevent.local`` is used there.
+Elsewhere context variables are used when Python has them, thread locals
+otherwise.
+"""
+
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+try:
+    from gevent import monkey
+    from gevent.local import local as greenlet_local
+    EVENTED = monkey.is_module_patched("threading")
+except ImportError:
+    greenlet_local = None
+    EVENTED = False
+
+
+class _LocalVar(object):
+    """A ``ContextVar`` look-alike stored in a thread or greenlet local."""
+
+    def __init__(self, name, local):
+        self._name = name
+        self._local = local
+
+    def get(self):
+        return getattr(self._local, "value", None)
+
+    def set(self, value):
+        """Set the value, returning the previous one to :meth:`reset` it."""
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+def _new_var(name, evented=EVENTED):
+    """Create a request variable in the storage of the worker type."""
+    if evented:
+        return _LocalVar(name, greenlet_local())
+    if contextvars is not None:
+        return contextvars.ContextVar(name, default=None)
+    return _LocalVar(name, threading.local())
+
+
+# WSGI environ of the running request
+_environ = _new_var("auth_brute_force_environ")
+# Authentication attempt being tracked, as a dict of its values
+_attempt = _new_var("auth_brute_force_attempt")
+
+
+def get_remote_addr():
+    """Get the remote address of the running request, if any."""
+    environ = _environ.get()
+    return environ and environ.get("REMOTE_ADDR") or False
+
+
+def get_attempt():
+    """Get the authentication attempt being tracked, if any."""
+    return _attempt.get()
+
+
+@contextmanager
+def tracking_attempt(attempt):
+    """Track an authentication attempt while inside this context."""
+    token = _attempt.set(attempt)
+    try:
+        yield attempt
+    finally:
+        _attempt.reset(token)
+
+
+def wrap_application(application):
+    """Make a WSGI application expose its environ while serving requests.
+
+    Wrapping an already wrapped application does nothing, so it is safe to
+    call it on every registry load.
+    """
+    if getattr(application, "_auth_brute_force_wrapped", False):
+        return application
+
+    @wraps(application)
+    def _wrapper(environ, start_response):
+        token = _environ.set(environ)
+        try:
+            return application(environ, start_response)
+        finally:
+            _environ.reset(token)
+
+    _wrapper._auth_brute_force_wrapped = True
+    return _wrapper
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import ast
+import logging
+from datetime import datetime, timedelta
+from openerp import api, fields, models
+from .alert_mailer import alert_mailer
+
+_logger = logging.getLogger(__name__)
+
+ALERT_HEADER = '''
+    <b>Attention!</b>
+    <br></br>
+    A new login attempt has made with wrong credentials!
+    '''
+# Alerts that could not be sent for this long are dropped
+ALERT_MAX_AGE = timedelta(days=1)
+
+
+class ResAuthenticationAlert(models.Model):
+    _name = 'res.authentication.alert'
+    _description = 'Pending Failed Login Alert'
+    _order = 'id'
+
+    remote = fields.Char(string='Remote IP', index=True)
+    subject = fields.Char(string='Subject', required=True)
+    body = fields.Text(string='Body', required=True)
+
+    @api.model
+    def send_digests(self):
+        """Send the pending alerts in per-remote digests, called by cron.
+
+        Alerts of a remote wait ``auth_brute_force.mail_digest_seconds``
+        after the first one, so later ones join the same digest. Each digest
+        is committed once sent, and alerts that could not be sent are tried
+        again on the next run.
+
+        :return int:
+            Amount of digests sent.
+        """
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        window = int(get_param("auth_brute_force.mail_digest_seconds", 60))
+        self._drop_old_alerts()
+        self.env.cr.execute("""
+            SELECT remote
+            FROM res_authentication_alert
+            GROUP BY remote
+            HAVING MIN(create_date) <=
+                (now() at time zone 'UTC') - %s * interval '1 second'
+        """, (window,))
+        remotes = [remote for remote, in self.env.cr.fetchall()]
+        if not remotes:
+            return 0
+        try:
+            config = (
+                get_param('BRUTAL_FORCE_MAIL_SERVER'),
+                get_param('BRUTAL_FORCE_MAIL_SERVER_PORT'),
+                get_param('BRUTAL_FORCE_MAIL_FROM'),
+                get_param('BRUTAL_FORCE_MAIL_FROM_PWD'),
+                self._mail_recipients(get_param('BRUTAL_FORCE_MAIL_TO')),
+            )
+        except Exception:
+            _logger.exception("Wrong alert mail configuration")
+            return 0
+        sent = 0
+        for remote in remotes:
+            alerts = self.search([("remote", "=", remote)])
+            if alert_mailer.send_digest(config, alerts[0].subject,
+                                        ALERT_HEADER, alerts.mapped("body")):
+                alerts.unlink()
+                self.env.cr.commit()
+                sent += 1
+        alert_mailer.close_idle()
+        return sent
+
+    @api.model
+    def _mail_recipients(self, value):
+        """Parse the ``BRUTAL_FORCE_MAIL_TO`` list of addresses.
+
+        :raise ValueError:
+            If the value is not a Python list or tuple literal.
+        """
+        recipients = ast.literal_eval(value or "[]")
+        if not isinstance(recipients, (list, tuple)):
+            raise ValueError("BRUTAL_FORCE_MAIL_TO must be a list of "
+                             "addresses, not %r" % (value,))
+        return tuple(recipients)
+
+    @api.model
+    def _drop_old_alerts(self):
+        cutoff = fields.Datetime.to_string(datetime.utcnow() - ALERT_MAX_AGE)
+        old = self.search([("create_date", "<", cutoff)])
+        if old:
+            _logger.warning("Dropping %d failed login alerts not sent "
+                            "since %s", len(old), cutoff)
+            old.unlink()
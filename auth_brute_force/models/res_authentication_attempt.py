@@ -3,17 +3,13 @@
 # Copyright 2018 OmniaSolutions - Daniel Smerghetto
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-import json
+import calendar
 import logging
-import urllib.request
+import time
 from openerp import api, fields, models
 from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.utils import COMMASPACE
-
-GEOLOCALISATION_URL = u"http://ip-api.com/json/{}"
+from .ban_counter import ban_counter
+from .remote_whitelist import get_whitelist
 
 _logger = logging.getLogger(__name__)
 
@@ -42,70 +38,105 @@ class ResAuthenticationAttempt(models.Model):
         compute="_compute_whitelisted",
     )
 
+    def _auto_init(self, cr, context=None):
+        """Index the columns searched by ban checks."""
+        res = super(ResAuthenticationAttempt, self)._auto_init(
+            cr, context=context)
+        for name, columns in (
+            ("res_authentication_attempt_remote_date_index",
+             "remote, create_date, result"),
+            ("res_authentication_attempt_remote_login_date_index",
+             "remote, login, create_date, result"),
+            ("res_authentication_attempt_create_date_index",
+             "create_date"),
+        ):
+            cr.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s",
+                       (name,))
+            if not cr.fetchone():
+                cr.execute("CREATE INDEX %s ON res_authentication_attempt "
+                           "(%s)" % (name, columns))
+        return res
+
     @api.multi
     def sendMail(self, subject='[Failed login access]'):
+        """Store alert mails, sent in digests by remote by cron."""
+        if not self.env.context.get('make_mail', True):
+            return
+        alertObj = self.env['res.authentication.alert'].sudo()
         for authAttemptBrws in self:
-            logging.info(self.env.context)
-            if not self.env.context.get('make_mail', True):
-                return
-            msg = '''
-    <b>Attention!</b>
-    <br></br>
-    A new login attempt has made with wrong credentials!
-    '''
-            
-            msg = msg + """<br></br> Date: %s""" % (authAttemptBrws.create_date)
+            msg = """<br></br> Date: %s""" % (authAttemptBrws.create_date)
             msg = msg + """<br></br> Result: %s""" % (authAttemptBrws.result)
             msg = msg + """<br></br> Username: %s""" % (authAttemptBrws.login)
             msg = msg + """<br></br> Remote IP: %s""" % (authAttemptBrws.remote)
-            msg = msg + """<br></br> Metadata: %s""" % (authAttemptBrws.remote_metadata.replace('\n', '<br></br>'))
-            
-            configParamObj = self.env['ir.config_parameter']
-            
-            SMPT_ADDRESS = configParamObj.get_param('BRUTAL_FORCE_MAIL_SERVER')
-            EMAIL_FROM = configParamObj.get_param('BRUTAL_FORCE_MAIL_FROM')
-            EMAIL_PASS = configParamObj.get_param('BRUTAL_FORCE_MAIL_FROM_PWD')
-            SMTP_PORT = configParamObj.get_param('BRUTAL_FORCE_MAIL_SERVER_PORT')
-            EMAIL_TO = eval(configParamObj.get_param('BRUTAL_FORCE_MAIL_TO'))
-            
-            conn = smtplib.SMTP_SSL(SMPT_ADDRESS + ':' + unicode(SMTP_PORT))
-            #conn.starttls()
-            conn.login(EMAIL_FROM, EMAIL_PASS)
-            eee = MIMEMultipart()
-            eee['Subject'] = subject
-            eee['From'] = EMAIL_FROM
-            eee['To'] = COMMASPACE.join(EMAIL_TO)
-            eee.attach(MIMEText(msg, 'html', 'utf-8'))
-            conn.sendmail(EMAIL_FROM, EMAIL_TO, eee.as_string())
-            conn.close()
+            msg = msg + """<br></br> Metadata: %s""" % ((authAttemptBrws.remote_metadata or '').replace('\n', '<br></br>'))
+            alertObj.create({'remote': authAttemptBrws.remote,
+                             'subject': subject,
+                             'body': msg})
 
     @api.multi
     @api.depends('remote')
     def _compute_metadata(self):
+        """Read metadata from the geolocation cache, filled by cron."""
+        metadata = self.env["res.authentication.geolocation"]._get_metadata(
+            self.mapped("remote"))
         for item in self:
-            url = GEOLOCALISATION_URL.format(item.remote)
-            try:
-                res = json.loads(urllib.request.urlopen(url, timeout=5).read())
-            except Exception:
-                _logger.warning(
-                    "Couldn't fetch details from %s",
-                    url,
-                    exc_info=True,
-                )
-            else:
-                item.remote_metadata = "\n".join(
-                    '%s: %s' % pair for pair in res.items())
+            item.remote_metadata = metadata.get(item.remote)
 
     @api.multi
     def _compute_whitelisted(self):
-        whitelist = self._whitelist_remotes()
+        whitelist = self._whitelist()
         for one in self:
             one.whitelisted = one.remote in whitelist
 
+    @api.multi
+    def unlink(self):
+        result = super(ResAuthenticationAttempt, self).unlink()
+        ban_counter.clear(self.env.cr.dbname)
+        return result
+
+    @api.model
+    def _load_failures(self, limit, remote, login=None, window=0):
+        """Read the most recent failures of a remote from the database.
+
+        Only failures after the last success, and inside ``window`` seconds
+        if given, are returned.
+
+        :return list:
+            UNIX times of at most ``limit`` failures.
+        """
+        where = "remote = %s"
+        params = [remote]
+        if login is not None:
+            where += " AND login = %s"
+            params.append(login)
+        query = """
+            SELECT create_date
+            FROM res_authentication_attempt
+            WHERE {where}
+                AND result IN ('failed', 'banned')
+                AND create_date > COALESCE(
+                    (SELECT MAX(create_date)
+                     FROM res_authentication_attempt
+                     WHERE {where} AND result = 'successful'),
+                    '-infinity')
+        """.format(where=where)
+        params = params * 2
+        if window:
+            query += " AND create_date > (now() at time zone 'UTC') - %s * interval '1 second'"
+            params.append(window)
+        query += " ORDER BY create_date DESC LIMIT %s"
+        params.append(limit)
+        self.env.cr.execute(query, params)
+        return [calendar.timegm(create_date.utctimetuple())
+                for create_date, in self.env.cr.fetchall()]
+
     @api.model
     def _hits_limit(self, limit, remote, login=None):
         """Know if a given remote hits a given limit.
 
+        Failures are counted in memory, reading them from the database only
+        the first time and every ``auth_brute_force.cache_ttl`` seconds.
+
         :param int limit:
             The maximum amount of failures allowed.
 
@@ -116,25 +147,21 @@ class ResAuthenticationAttempt(models.Model):
             If you want to check the IP+login combination limit, supply the
             login.
         """
-        domain = [
-            ("remote", "=", remote),
-        ]
-        if login is not None:
-            domain += [("login", "=", login)]
-        # Find last successful login
-        last_ok = self.search(
-            domain + [("result", "=", "successful")],
-            order='create_date desc',
-            limit=1,
-        )
-        if last_ok:
-            domain += [("create_date", ">", last_ok.create_date)]
-        # Count failures since last success, if any
-        recent_failures = self.search_count(
-            domain + [("result", "!=", "successful")],
-        )
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        window = int(get_param("auth_brute_force.window_seconds", 0))
+        ttl = int(get_param("auth_brute_force.cache_ttl", 60))
+        key = (self.env.cr.dbname, remote, login)
+        now = time.time()
+        failures = ban_counter.failures(key, now, window, ttl)
+        if failures is None:
+            failures = ban_counter.load(
+                key,
+                self._load_failures(limit, remote, login, window),
+                now,
+                limit,
+            )
         # Did we hit the limit?
-        return recent_failures >= limit
+        return failures >= limit
 
     @api.model
     def _trusted(self, remote, login):
@@ -154,7 +181,7 @@ class ResAuthenticationAttempt(models.Model):
             return True
         get_param = self.env["ir.config_parameter"].sudo().get_param
         # Whitelisted remotes always pass
-        if remote in self._whitelist_remotes():
+        if remote in self._whitelist():
             return True
         # Check if remote is banned
         limit = int(get_param("auth_brute_force.max_by_ip", 50))
@@ -193,6 +220,18 @@ class ResAuthenticationAttempt(models.Model):
         )
         return set(whitelist.split(","))
 
+    def _whitelist(self):
+        """Get the compiled whitelist, supporting CIDR blocks and IPv6.
+
+        :return RemoteWhitelist:
+            Supports ``remote in whitelist`` checks.
+        """
+        return get_whitelist(
+            self.env.cr.dbname,
+            self.env["ir.config_parameter"].sudo().get_param(
+                "auth_brute_force.whitelist_remotes", ""),
+        )
+
     @api.multi
     def action_whitelist_add(self):
         """Add current remotes to whitelist."""
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import json
+import logging
+from datetime import datetime, timedelta
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from openerp import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import geoip2.database
+    import geoip2.errors
+except ImportError:
+    _logger.debug("Cannot import geoip2, local GeoIP databases disabled")
+    geoip2 = None
+
+GEOLOCALISATION_URL = u"http://ip-api.com/json/{}"
+# ip-api.com free tier allows 45 requests per minute, and the cron runs
+# every 5 minutes, so staying below it in each run is enough
+IP_API_LOOKUPS_PER_RUN = 40
+# Only remotes of attempts this recent are resolved
+RECENT_ATTEMPTS = timedelta(days=1)
+
+# GeoIP database path -> open reader
+_geoip_readers = {}
+
+
+class ResAuthenticationGeolocation(models.Model):
+    _name = 'res.authentication.geolocation'
+    _description = 'Authentication Remote Geolocation'
+    _rec_name = 'remote'
+
+    remote = fields.Char(string='Remote IP', required=True, index=True)
+    metadata = fields.Text(string='Metadata')
+    fetch_date = fields.Datetime(string='Fetched On', required=True)
+    failed = fields.Boolean(
+        string='Lookup Failed',
+        help="Failed lookups are tried again after "
+             "auth_brute_force.geolocation_retry_minutes",
+    )
+
+    _sql_constraints = [
+        ('remote_uniq', 'unique(remote)', 'Remote IP must be unique!'),
+    ]
+
+    @api.model
+    def _get_metadata(self, remotes):
+        """Get cached metadata of some remotes, without resolving them.
+
+        :param iterable remotes:
+            Remote IPs to search for.
+
+        :return dict:
+            Metadata by remote IP, only for remotes already resolved.
+        """
+        remotes = list(set(filter(None, remotes)))
+        if not remotes:
+            return {}
+        rows = self.sudo().search_read(
+            [("remote", "in", remotes)], ["remote", "metadata"])
+        return {row["remote"]: row["metadata"] for row in rows}
+
+    @api.model
+    def _resolve(self, remote):
+        """Resolve the metadata of a remote IP.
+
+        Override this method to plug in a different resolver.
+
+        :return dict:
+            Metadata of the remote, empty if unknown.
+        """
+        path = self.env["ir.config_parameter"].sudo().get_param(
+            "auth_brute_force.geoip_database")
+        if path:
+            return self._resolve_geoip_file(path, remote)
+        return self._resolve_ip_api(remote)
+
+    @api.model
+    def _resolve_ip_api(self, remote):
+        url = GEOLOCALISATION_URL.format(remote)
+        return json.loads(urlopen(url, timeout=5).read())
+
+    @api.model
+    def _resolve_geoip_file(self, path, remote):
+        if geoip2 is None:
+            _logger.warning(
+                "Python library geoip2 is needed to read %s", path)
+            return {}
+        reader = _geoip_readers.get(path)
+        if reader is None:
+            reader = _geoip_readers[path] = geoip2.database.Reader(path)
+        try:
+            city = reader.city(remote)
+        except geoip2.errors.AddressNotFoundError:
+            return {}
+        return {
+            "country": city.country.name,
+            "countryCode": city.country.iso_code,
+            "regionName": city.subdivisions.most_specific.name,
+            "city": city.city.name,
+            "zip": city.postal.code,
+            "lat": city.location.latitude,
+            "lon": city.location.longitude,
+            "timezone": city.location.time_zone,
+        }
+
+    @api.model
+    def _stale_remotes(self, limit):
+        """Remotes of recent attempts that are not resolved or expired.
+
+        Failed lookups expire after ``geolocation_retry_minutes``, successful
+        ones after ``geolocation_ttl_days``.
+
+        :return list:
+            At most ``limit`` remote IPs.
+        """
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        now = datetime.utcnow()
+        ttl_days = int(get_param("auth_brute_force.geolocation_ttl_days", 30))
+        retry_minutes = int(get_param(
+            "auth_brute_force.geolocation_retry_minutes", 60))
+        self.env.cr.execute("""
+            SELECT attempt.remote
+            FROM (
+                SELECT DISTINCT remote
+                FROM res_authentication_attempt
+                WHERE create_date > %(recent)s AND remote IS NOT NULL
+            ) attempt
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM res_authentication_geolocation geo
+                WHERE geo.remote = attempt.remote
+                    AND geo.fetch_date >= CASE WHEN geo.failed
+                        THEN %(retry)s ELSE %(expiry)s END
+            )
+            LIMIT %(limit)s
+        """, {
+            "recent": fields.Datetime.to_string(now - RECENT_ATTEMPTS),
+            "retry": fields.Datetime.to_string(
+                now - timedelta(minutes=retry_minutes)),
+            "expiry": fields.Datetime.to_string(
+                now - timedelta(days=ttl_days)),
+            "limit": limit,
+        })
+        return [remote for remote, in self.env.cr.fetchall()]
+
+    @api.model
+    def update_geolocations(self, limit=100):
+        """Resolve unknown and expired remotes, called by cron.
+
+        Remotes that cannot be resolved are marked as failed, keeping any
+        metadata they had, so they are tried again after a short while.
+        Through ip-api.com, at most ``IP_API_LOOKUPS_PER_RUN`` remotes are
+        resolved, and the run stops when the service rate limits it.
+        """
+        if not self.env["ir.config_parameter"].sudo().get_param(
+                "auth_brute_force.geoip_database"):
+            limit = min(limit, IP_API_LOOKUPS_PER_RUN)
+        remotes = self._stale_remotes(limit)
+        existing = {
+            geo.remote: geo
+            for geo in self.search([("remote", "in", remotes)])
+        }
+        now = fields.Datetime.now()
+        for remote in remotes:
+            vals = {"fetch_date": now}
+            try:
+                res = self._resolve(remote)
+            except HTTPError as error:
+                if error.code == 429:
+                    _logger.warning("Geolocation rate limited, %s and the "
+                                    "next remotes wait for the next run",
+                                    remote)
+                    break
+                _logger.warning(
+                    "Couldn't fetch details of %s", remote, exc_info=True)
+                vals["failed"] = True
+            except Exception:
+                _logger.warning(
+                    "Couldn't fetch details of %s", remote, exc_info=True)
+                vals["failed"] = True
+            else:
+                vals.update({
+                    "metadata": "\n".join(
+                        '%s: %s' % pair for pair in sorted(res.items())),
+                    "failed": False,
+                })
+            if remote in existing:
+                existing[remote].write(vals)
+            else:
+                vals["remote"] = remote
+                self.create(vals)
+        return True
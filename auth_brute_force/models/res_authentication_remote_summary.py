@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+from datetime import datetime, timedelta
+from openerp import api, fields, models
+from .ban_counter import ban_counter
+
+_logger = logging.getLogger(__name__)
+
+
+class ResAuthenticationRemoteSummary(models.Model):
+    _name = 'res.authentication.remote.summary'
+    _description = 'Authentication History by Remote'
+    _order = 'last_date desc'
+    _rec_name = 'remote'
+
+    remote = fields.Char(string='Remote IP', required=True, index=True)
+    successful_count = fields.Integer(string='Successful', readonly=True)
+    failed_count = fields.Integer(string='Failed', readonly=True)
+    banned_count = fields.Integer(string='Banned', readonly=True)
+    first_date = fields.Datetime(string='First Attempt', readonly=True)
+    last_date = fields.Datetime(string='Last Attempt', readonly=True)
+    last_failure_date = fields.Datetime(string='Last Failure', readonly=True)
+
+    _sql_constraints = [
+        ('remote_uniq', 'unique(remote)', 'Remote IP must be unique!'),
+    ]
+
+    @api.model
+    def prune_attempts(self, limit=100000):
+        """Move old attempts into the per-remote summary, called by cron.
+
+        Attempts older than ``auth_brute_force.retention_days`` are deleted
+        and their counters are added to the summary of their remote, in a
+        single statement. Everything older than the cutoff goes, whatever
+        the result: keeping old failures while dropping the successes after
+        them would count them again towards a ban.
+
+        :param int limit:
+            Maximum attempts pruned per call, so a large backlog is pruned
+            over several runs.
+
+        :return int:
+            Amount of attempts pruned.
+        """
+        days = int(self.env["ir.config_parameter"].sudo().get_param(
+            "auth_brute_force.retention_days", 90))
+        if days <= 0:
+            return 0
+        cutoff = fields.Datetime.to_string(
+            datetime.utcnow() - timedelta(days=days))
+        self.env.cr.execute("""
+            WITH pruned AS (
+                DELETE FROM res_authentication_attempt
+                WHERE id IN (
+                    SELECT id
+                    FROM res_authentication_attempt
+                    WHERE create_date < %(cutoff)s
+                    ORDER BY create_date
+                    LIMIT %(limit)s)
+                RETURNING remote, result, create_date
+            ), summary AS (
+                INSERT INTO res_authentication_remote_summary (
+                    remote, successful_count, failed_count, banned_count,
+                    first_date, last_date, last_failure_date,
+                    create_uid, create_date, write_uid, write_date)
+                SELECT remote,
+                    COUNT(*) FILTER (WHERE result = 'successful'),
+                    COUNT(*) FILTER (WHERE result = 'failed'),
+                    COUNT(*) FILTER (WHERE result = 'banned'),
+                    MIN(create_date),
+                    MAX(create_date),
+                    MAX(create_date) FILTER (
+                        WHERE result IN ('failed', 'banned')),
+                    %(uid)s, now() at time zone 'UTC',
+                    %(uid)s, now() at time zone 'UTC'
+                FROM pruned
+                WHERE remote IS NOT NULL
+                GROUP BY remote
+                ON CONFLICT (remote) DO UPDATE SET
+                    successful_count = res_authentication_remote_summary
+                        .successful_count + EXCLUDED.successful_count,
+                    failed_count = res_authentication_remote_summary
+                        .failed_count + EXCLUDED.failed_count,
+                    banned_count = res_authentication_remote_summary
+                        .banned_count + EXCLUDED.banned_count,
+                    first_date = LEAST(res_authentication_remote_summary
+                        .first_date, EXCLUDED.first_date),
+                    last_date = GREATEST(res_authentication_remote_summary
+                        .last_date, EXCLUDED.last_date),
+                    last_failure_date = GREATEST(
+                        res_authentication_remote_summary.last_failure_date,
+                        EXCLUDED.last_failure_date),
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+            )
+            SELECT COUNT(*) FROM pruned
+        """, {"cutoff": cutoff, "limit": limit, "uid": self.env.uid})
+        pruned = self.env.cr.fetchone()[0]
+        if pruned:
+            _logger.info("Pruned %d authentication attempts older than %s",
+                         pruned, cutoff)
+            self.env["res.authentication.attempt"].invalidate_cache()
+            self.invalidate_cache()
+            ban_counter.clear(self.env.cr.dbname)
+        return pruned
@@ -4,11 +4,13 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
 import logging
+import time
 from contextlib import contextmanager
-from threading import current_thread
 from openerp import api, models, SUPERUSER_ID
 from openerp.exceptions import AccessDenied
 from openerp.service import wsgi_server
+from . import request_context
+from .ban_counter import ban_counter
 
 _logger = logging.getLogger(__name__)
 
@@ -19,48 +21,47 @@ class ResUsers(models.Model):
     # HACK https://github.com/odoo/odoo/issues/24183
     # TODO Remove in v12, and use normal odoo.http.request to get details
     def _register_hook(self, cr):
-        """🐒-patch XML-RPC controller to know remote address."""
-        original_fn = wsgi_server.application_unproxied
+        """Wrap the WSGI application to know the remote address.
 
-        def _patch(environ, start_response):
-            current_thread().environ = environ
-            return original_fn(environ, start_response)
-
-        wsgi_server.application_unproxied = _patch
+        XML-RPC requests have no ``odoo.http.request``, so the environ is
+        exposed through :mod:`request_context` instead.
+        """
+        wsgi_server.application_unproxied = request_context.wrap_application(
+            wsgi_server.application_unproxied)
 
     # Helpers to track authentication attempts
     @classmethod
     @contextmanager
     def _auth_attempt(cls, login):
-        """Start an authentication attempt and track its state."""
-        try:
-            # Check if this call is nested
-            attempt_id = current_thread().auth_attempt_id
-        except AttributeError:
-            # Not nested; create a new attempt
-            attempt_id = cls._auth_attempt_new(login)
-        if not attempt_id:
-            # No attempt was created, so there's nothing to do here
+        """Start an authentication attempt and track its state.
+
+        The attempt is only kept in memory while authenticating, and stored
+        with its result at the end, using a single cursor.
+        """
+        # Check if this call is nested
+        attempt = request_context.get_attempt()
+        nested = attempt is not None
+        if not nested:
+            # Not nested; start a new attempt
+            attempt = cls._auth_attempt_new(login)
+        if not attempt:
+            # No attempt was started, so there's nothing to do here
             yield
             return
         try:
-            current_thread().auth_attempt_id = attempt_id
-            result = "successful"
-            try:
-                yield
-            except AccessDenied as error:
-                result = getattr(error, "reason", "failed")
-                with cls.pool.cursor() as cr:
-                    env = api.Environment(cr, SUPERUSER_ID, {})
-                    env["res.authentication.attempt"].browse(attempt_id).sendMail()
-                raise
-            finally:
-                cls._auth_attempt_update({"result": result})
+            with request_context.tracking_attempt(attempt):
+                result = "successful"
+                try:
+                    yield
+                except AccessDenied as error:
+                    result = getattr(error, "reason", "failed")
+                    raise
+                finally:
+                    cls._auth_attempt_update({"result": result})
         finally:
-            try:
-                del current_thread().auth_attempt_id
-            except AttributeError:
-                pass  # It was deleted already
+            # The outermost call stores the attempt
+            if not nested:
+                cls._auth_attempt_save(attempt)
 
     @classmethod
     def _auth_attempt_force_raise(cls, login, method):
@@ -77,38 +78,60 @@ class ResUsers(models.Model):
 
     @classmethod
     def _auth_attempt_new(cls, login):
-        """Store one authentication attempt, not knowing the result."""
+        """Start one authentication attempt, not knowing the result."""
         # Get the right remote address
-        try:
-            remote_addr = current_thread().environ["REMOTE_ADDR"]
-        except (KeyError, AttributeError):
-            remote_addr = False
+        remote_addr = request_context.get_remote_addr()
         # Exit if it doesn't make sense to store this attempt
         if not remote_addr:
             return False
-        # Use a separate cursor to keep changes always
-        with cls.pool.cursor() as cr:
-            env = api.Environment(cr, SUPERUSER_ID, {})
-            attempt = env["res.authentication.attempt"].create({
-                "login": login,
-                "remote": remote_addr,
-            })
-            return attempt.id
+        return {
+            "login": login,
+            "remote": remote_addr,
+            "result": False,
+        }
 
     @classmethod
     def _auth_attempt_update(cls, values):
-        """Update a given auth attempt if we still ignore its result."""
-        auth_id = getattr(current_thread(), "auth_attempt_id", False)
-        if not auth_id:
+        """Update the running auth attempt if we still ignore its result."""
+        attempt = request_context.get_attempt()
+        if not attempt:
             return {}  # No running auth attempt; nothing to do
+        # Update only on 1st call
+        if not attempt["result"]:
+            attempt.update(values)
+        return dict(attempt)
+
+    @classmethod
+    def _auth_attempt_save(cls, values):
+        """Store a finished auth attempt and alert about failures."""
+        pending = values.pop("pending", None)
+        try:
+            cls._auth_attempt_store(values)
+        finally:
+            if pending:
+                ban_counter.end(*pending)
+
+    @classmethod
+    def _auth_attempt_store(cls, values):
         # Use a separate cursor to keep changes always
         with cls.pool.cursor() as cr:
             env = api.Environment(cr, SUPERUSER_ID, {})
-            attempt = env["res.authentication.attempt"].browse(auth_id)
-            # Update only on 1st call
-            if not attempt.result:
-                attempt.write(values)
-            return attempt.copy_data()[0] if attempt else {}
+            attempt = env["res.authentication.attempt"].create(values)
+            # The attempt must be kept even if alerting fails
+            cr.commit()
+            # Count it only once committed, a rolled back attempt never
+            # happened
+            ban_counter.record(cr.dbname, values["remote"], values["login"],
+                               values["result"], time.time())
+            if attempt.result != "successful":
+                try:
+                    # Only stored, mails are sent by cron
+                    attempt.sendMail()
+                except Exception:
+                    cr.rollback()
+                    _logger.exception(
+                        "Couldn't alert about authentication attempt %d",
+                        attempt.id)
 
     # Override all auth-related core methods
     def _login(self, db, login, password):
@@ -147,5 +170,10 @@ class ResUsers(models.Model):
                 error = AccessDenied()
                 error.reason = "banned"
                 raise error
+            # Count it as failed until its result is recorded
+            if remote and not attempt.get("pending"):
+                pending = (self.env.cr.dbname, remote, login)
+                ban_counter.begin(*pending)
+                request_context.get_attempt()["pending"] = pending
             # Continue with other auth systems
             return super(ResUsers, self).check_credentials(password)
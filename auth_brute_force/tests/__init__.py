@@ -1,3 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from . import test_brute_force
+from . import test_ban_counter
+from . import test_alert_mailer
+from . import test_remote_whitelist
+from . import test_request_context
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import smtplib
+from unittest import TestCase
+
+from mock import patch
+
+from ..models import alert_mailer
+
+CONFIG = ("smtp.example.com", "465", "from@example.com", "pwd",
+          ("to@example.com",))
+
+
+@patch(alert_mailer.__name__ + ".smtplib.SMTP_SSL")
+class AlertMailerCase(TestCase):
+    def setUp(self):
+        super(AlertMailerCase, self).setUp()
+        self.mailer = alert_mailer.AlertMailer()
+
+    def test_connection_reused(self, smtp_ssl):
+        """Digests share one SMTP connection."""
+        self.assertTrue(self.mailer.send_digest(CONFIG, "Alert", "", ["a"]))
+        self.assertTrue(
+            self.mailer.send_digest(CONFIG, "Alert", "", ["b", "c"]))
+        self.assertEqual(smtp_ssl.call_count, 1)
+        conn = smtp_ssl.return_value
+        self.assertEqual(conn.sendmail.call_count, 2)
+        self.assertIn("Alert (2 attempts)", conn.sendmail.call_args[0][2])
+
+    def test_reconnect(self, smtp_ssl):
+        """A dropped connection is opened again."""
+        conn = smtp_ssl.return_value
+        conn.sendmail.side_effect = [None, smtplib.SMTPServerDisconnected,
+                                     None]
+        self.mailer.send_digest(CONFIG, "Alert", "", ["a"])
+        self.mailer.send_digest(CONFIG, "Alert", "", ["b"])
+        self.assertEqual(smtp_ssl.call_count, 2)
+        self.assertEqual(conn.sendmail.call_count, 3)
+
+    def test_close_idle(self, smtp_ssl):
+        """Idle connections are closed."""
+        self.mailer.send_digest(CONFIG, "Alert", "", ["a"])
+        self.mailer.close_idle(
+            self.mailer._connections[CONFIG][1] + self.mailer.idle_timeout)
+        self.assertFalse(self.mailer._connections)
+        smtp_ssl.return_value.quit.assert_called_once_with()
+
+    def test_failure(self, smtp_ssl):
+        """Unsent digests are reported, so their alerts are kept."""
+        smtp_ssl.return_value.sendmail.side_effect = smtplib.SMTPException
+        self.assertFalse(self.mailer.send_digest(CONFIG, "Alert", "", ["a"]))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from unittest import TestCase
+
+from ..models.ban_counter import BanCounter
+
+
+class BanCounterCase(TestCase):
+    def setUp(self):
+        super(BanCounterCase, self).setUp()
+        self.counter = BanCounter()
+        self.key = ("db", "127.0.0.1", "demo")
+        self.ip_key = ("db", "127.0.0.1", None)
+
+    def test_unknown_needs_load(self):
+        """Unknown and expired entries must be loaded again."""
+        self.assertIsNone(self.counter.failures(self.key, 100))
+        self.counter.load(self.key, [90, 95], 100, 10)
+        self.assertEqual(self.counter.failures(self.key, 150, ttl=60), 2)
+        self.assertIsNone(self.counter.failures(self.key, 161, ttl=60))
+
+    def test_record(self):
+        """Failures accumulate and a success resets both counters."""
+        self.counter.load(self.key, [], 100, 3)
+        self.counter.load(self.ip_key, [80], 100, 5)
+        for now in (101, 102, 103, 104):
+            self.counter.record("db", "127.0.0.1", "demo", "failed", now)
+        # Bounded by the limit it was loaded with
+        self.assertEqual(self.counter.failures(self.key, 105), 3)
+        self.assertEqual(self.counter.failures(self.ip_key, 105), 5)
+        self.counter.record("db", "127.0.0.1", "demo", "successful", 106)
+        self.assertEqual(self.counter.failures(self.key, 107), 0)
+        self.assertEqual(self.counter.failures(self.ip_key, 107), 0)
+
+    def test_window(self):
+        """Failures older than the window are forgotten."""
+        self.counter.load(self.key, [10, 50, 90], 100, 10)
+        self.assertEqual(self.counter.failures(self.key, 100, window=30), 1)
+
+    def test_clear(self):
+        """Clearing a database forgets only its entries."""
+        other = ("other", "127.0.0.1", None)
+        self.counter.load(self.key, [90], 100, 10)
+        self.counter.load(other, [90], 100, 10)
+        self.counter.clear("db")
+        self.assertIsNone(self.counter.failures(self.key, 100))
+        self.assertEqual(self.counter.failures(other, 100), 1)
+
+    def test_expired_purged(self):
+        """Expired entries are dropped, not only ignored."""
+        self.counter.load(self.key, [90], 100, 10)
+        self.counter.load(self.ip_key, [90], 150, 10)
+        self.counter.record("db", "10.0.0.1", "demo", "failed", 161)
+        self.assertNotIn(self.key, self.counter._entries)
+        self.assertIn(self.ip_key, self.counter._entries)
+
+    def test_max_entries(self):
+        """Least recently used entries are dropped past the maximum."""
+        counter = BanCounter(max_entries=2)
+        first = ("db", "10.0.0.1", None)
+        second = ("db", "10.0.0.2", None)
+        counter.load(first, [], 100, 10)
+        counter.load(second, [], 100, 10)
+        # Using the first one makes the second the least recently used
+        self.assertEqual(counter.failures(first, 101), 0)
+        counter.load(self.key, [], 102, 10)
+        self.assertEqual(counter.failures(first, 103), 0)
+        self.assertIsNone(counter.failures(second, 103))
+        self.assertEqual(counter.failures(self.key, 103), 0)
+
+    def test_pending(self):
+        """Attempts being checked count as failures until they end."""
+        self.counter.load(self.key, [90], 100, 10)
+        self.counter.begin("db", "127.0.0.1", "demo")
+        self.counter.begin("db", "127.0.0.1", "demo")
+        self.assertEqual(self.counter.failures(self.key, 101), 3)
+        # Also when the entry is loaded while they are pending
+        self.assertEqual(self.counter.load(self.ip_key, [90], 101, 10), 3)
+        # A recorded failure replaces its pending count
+        self.counter.record("db", "127.0.0.1", "demo", "failed", 102)
+        self.counter.end("db", "127.0.0.1", "demo")
+        self.assertEqual(self.counter.failures(self.key, 103), 3)
+        self.counter.record("db", "127.0.0.1", "demo", "successful", 104)
+        self.counter.end("db", "127.0.0.1", "demo")
+        self.assertEqual(self.counter.failures(self.key, 105), 0)
+        self.assertFalse(self.counter._pending)
@@ -2,7 +2,6 @@
 # Copyright 2017 Tecnativa - Jairo Llopis
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from threading import current_thread
 from urllib import urlencode
 
 from decorator import decorator
@@ -14,7 +13,11 @@ from openerp.tests.common import at_install, HttpCase, post_install
 from openerp.tools import mute_logger
 from openerp.modules.registry import RegistryManager
 
-from ..models import res_authentication_attempt, res_users
+from ..models import (
+    res_authentication_attempt,
+    res_authentication_geolocation,
+    res_users,
+)
 
 
 GARBAGE_LOGGERS = (
@@ -54,18 +57,10 @@ def skip_unless_addons_installed(*addons):
 # Skip specific browser forgery on redirections
 @patch(http.__name__ + ".redirect_with_hash", side_effect=redirect)
 # Faster tests without calls to geolocation API
-@patch(res_authentication_attempt.__name__ + ".urlopen", return_value="")
+@patch(res_authentication_geolocation.__name__ + ".urlopen", return_value="")
 class BruteForceCase(HttpCase):
     def setUp(self):
         super(BruteForceCase, self).setUp()
-        # Some tests could retain environ from last test and produce fake
-        # results without this patch
-        # HACK https://github.com/odoo/odoo/issues/24183
-        # TODO Remove in v12
-        try:
-            del current_thread().environ
-        except AttributeError:
-            pass
         # Complex password to avoid conflicts with `password_security`
         self.good_password = "Admin$%02584"
         self.data_demo = {
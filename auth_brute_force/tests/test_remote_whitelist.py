@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from unittest import TestCase
+
+from ..models.remote_whitelist import RemoteWhitelist, get_whitelist
+
+
+class RemoteWhitelistCase(TestCase):
+    def test_ips_and_networks(self):
+        """Single IPs and CIDR blocks of both versions match."""
+        whitelist = RemoteWhitelist(
+            ["127.0.0.1", " 10.1.0.0/16", "2001:db8::/32", ""])
+        self.assertIn("127.0.0.1", whitelist)
+        self.assertIn("10.1.255.3", whitelist)
+        self.assertIn("2001:db8::1", whitelist)
+        self.assertIn("::ffff:10.1.0.1", whitelist)
+        self.assertNotIn("127.0.0.2", whitelist)
+        self.assertNotIn("10.2.0.1", whitelist)
+        self.assertNotIn("2001:db9::1", whitelist)
+        self.assertNotIn("", whitelist)
+        self.assertNotIn(False, whitelist)
+
+    def test_cache(self):
+        """Compiled again only when the parameter changes."""
+        first = get_whitelist("db", "127.0.0.1")
+        self.assertIs(get_whitelist("db", "127.0.0.1"), first)
+        second = get_whitelist("db", "127.0.0.1,10.0.0.0/8")
+        self.assertIsNot(second, first)
+        self.assertIn("10.0.0.1", second)
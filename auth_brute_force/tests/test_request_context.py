@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 OmniaSolutions - Daniel Smerghetto
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import threading
+from unittest import TestCase, skipIf
+
+from ..models import request_context
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+
+class RequestContextCase(TestCase):
+    def test_environ_reset(self):
+        """The remote is only known while serving the request."""
+        seen = []
+
+        def application(environ, start_response):
+            seen.append(request_context.get_remote_addr())
+            return []
+
+        wrapped = request_context.wrap_application(application)
+        self.assertIs(request_context.wrap_application(wrapped), wrapped)
+        wrapped({"REMOTE_ADDR": "127.0.0.1"}, None)
+        self.assertEqual(seen, ["127.0.0.1"])
+        self.assertFalse(request_context.get_remote_addr())
+
+    def test_attempt_not_shared(self):
+        """Other threads do not see the tracked attempt."""
+        seen = []
+        with request_context.tracking_attempt({"login": "demo"}):
+            thread = threading.Thread(
+                target=lambda: seen.append(request_context.get_attempt()))
+            thread.start()
+            thread.join()
+            self.assertEqual(request_context.get_attempt(), {"login": "demo"})
+        self.assertEqual(seen, [None])
+        self.assertIsNone(request_context.get_attempt())
+
+    @skipIf(gevent is None, "gevent is not installed")
+    def test_attempt_not_shared_greenlet(self):
+        """Other greenlets of evented workers do not see the value."""
+        var = request_context._new_var("test", evented=True)
+        seen = {}
+
+        def track(login):
+            token = var.set(login)
+            # Let the other greenlet set its value
+            gevent.sleep(0)
+            seen[login] = var.get()
+            var.reset(token)
+
+        gevent.joinall([gevent.spawn(track, "demo"),
+                        gevent.spawn(track, "admin")])
+        self.assertEqual(seen, {"demo": "demo", "admin": "admin"})
+        self.assertIsNone(var.get())
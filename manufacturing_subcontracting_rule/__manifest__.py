@@ -53,6 +53,9 @@
              'views/mrp_bom.xml',
              'views/res_partner.xml',
              'views/mrp_workorder.xml',
+             'views/mrp_unreserve_log.xml',
+             #  data
+             'data/ir_cron.xml',
     ],
     'installable': True,
     'application': False,
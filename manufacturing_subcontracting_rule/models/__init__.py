@@ -32,8 +32,10 @@ Created on Dec 18, 2017
 @author: daniel
 '''
 
+from . import mrp_unreserve_log
 from . import mrp_production
 from . import stock_picking
+from . import stock_picking_type
 from . import mrp_workorder
 from . import mrp_routing_workcenter
 from . import stock_move
@@ -41,6 +41,8 @@ import logging
 import datetime
 from datetime import timedelta
 from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT
+from odoo.tools.sql import column_exists
+from .mrp_unreserve_log import UNRESERVE_BATCH_SIZE
 
 
 class MrpProduction(models.Model):
@@ -64,13 +66,14 @@ class MrpProduction(models.Model):
         """
             create line for the bom
         """
-        stock_move_bomObj = self.env['stock.bom']
+        bomLines = []
         for bom_line in self.bom_id.bom_line_ids:
             vals = {'source_product_id': self.product_id.id,
                     'raw_product_id': bom_line.product_id.id,
-                    'quantity': bom_line.product_qty,
-                    'mrp_production_id': self.id}
-            stock_move_bomObj.create(vals)
+                    'quantity': bom_line.product_qty}
+            bomLines.append((0, False, vals))
+        if bomLines:
+            self.write({'stock_bom_ids': bomLines})
 
     @api.model
     def getQuantToRemove(self, product_id, qty):
@@ -109,19 +112,44 @@ class MrpProduction(models.Model):
                                                       copy=False,
                                                       states={'done': [('readonly', True)], 'cancel': [('readonly', True)]})
     external_pickings = fields.One2many('stock.picking', 'external_production', string='External Pikings')
+    external_purchase_ids = fields.Many2many('purchase.order',
+                                             'mrp_production_external_purchase_rel',
+                                             'production_id',
+                                             'purchase_id',
+                                             string=_('External Purchases'),
+                                             copy=False,
+                                             readonly=True)
+
+    @api.model_cr
+    def init(self):
+        """
+            Link the external purchases created before the links were stored.
+            On install the source columns may not exist yet, as purchase models are set up after this one
+        """
+        cr = self.env.cr
+        queries = []
+        if column_exists(cr, 'purchase_order', 'production_external_id'):
+            queries.append("""SELECT production_external_id, id
+                              FROM purchase_order
+                              WHERE production_external_id IS NOT NULL""")
+        if column_exists(cr, 'purchase_order_line', 'production_external_id'):
+            queries.append("""SELECT production_external_id, order_id
+                              FROM purchase_order_line
+                              WHERE production_external_id IS NOT NULL""")
+        if queries:
+            cr.execute("""
+                INSERT INTO mrp_production_external_purchase_rel (production_id, purchase_id)
+                %s
+                ON CONFLICT DO NOTHING
+            """ % ' UNION '.join(queries))
 
     @api.multi
     def open_external_purchase(self):
         newContext = self.env.context.copy()
-        manufacturingIds = []
         if self.purchase_external_id:
             manufacturingIds = [self.purchase_external_id.id]
         else:
-            purchaseLines = self.env['purchase.order.line'].search([('production_external_id', '=', self.id)])
-            purchaseList = self.env['purchase.order'].browse()
-            for purchaseLineBrws in purchaseLines:
-                purchaseList = purchaseList + purchaseLineBrws.order_id
-            manufacturingIds = purchaseList.ids
+            manufacturingIds = self.external_purchase_ids.ids
         return {
             'name': _("Purchase External"),
             'view_type': 'form',
@@ -135,9 +163,7 @@ class MrpProduction(models.Model):
     @api.multi
     def open_external_pickings(self):
         newContext = self.env.context.copy()
-        srock_picking_ids = []
-        for mrp_workorder_id in self.workorder_ids:
-            srock_picking_ids.extend(mrp_workorder_id.getExternalPickings().ids)
+        srock_picking_ids = self.workorder_ids.mapped('external_picking_ids').ids
         srock_picking_ids.extend(self.external_pickings.ids)
         return {
             'name': _("External Pickings"),
@@ -164,11 +190,7 @@ class MrpProduction(models.Model):
         return isOut
 
     def getSupplierLocation(self):
-        for lock in self.env['stock.location'].search([('usage', '=', 'supplier'),
-                                                       ('active', '=', True),
-                                                       ('company_id', '=', False)]):
-            return lock.id
-        return False
+        return self.env['stock.location'].getSupplierLocationId()
 
     def createTmpStockMove(self, sourceMoveObj, location_source_id=None, location_dest_id=None, unit_factor=1.0):
         tmpMoveObj = self.env["stock.tmp_move"]
@@ -231,11 +253,9 @@ class MrpProduction(models.Model):
     def createProductionLocation(self, locationName):
 
         def getParentLocation():
-            locations = locationObj.with_context({'lang': 'en_US'}).search([
-                ('usage', '=', 'supplier'),
-                ('name', '=', 'Vendors')])
+            locations = locationObj.getVendorsLocation()
             if locations:
-                return locations[-1]
+                return locations
             raise UserError("No Vendor location defined")
         locationObj = self.env['stock.location']
         parentLoc = getParentLocation()
@@ -286,29 +306,28 @@ class MrpProduction(models.Model):
 
     @api.multi
     def button_cancel_produce_externally(self):
+        """
+            Cancel the external production of all the productions at once
+        """
         stockPickingObj = self.env['stock.picking']
-        purchaseOrderObj = self.env['purchase.order']
-        for manOrderBrws in self:
-            moves = self.env['stock.move']
-            stockPickList = stockPickingObj.search([('origin', '=', manOrderBrws.name)])
-            stockPickList += stockPickingObj.search([('sub_production_id', '=', manOrderBrws.id)])
-            for pickBrws in list(set(stockPickList)):
-                pickBrws.action_cancel()
-                moves += pickBrws.move_lines
-            manOrderBrws.write({'state': 'confirmed'})
-            movesToCancel = self.env['stock.move'].search([('subcontracting_move_id', 'in', moves.ids)])
-            movesToCancel += manOrderBrws.move_raw_ids + manOrderBrws.move_finished_ids
-            for move_line in movesToCancel:
-                if move_line.mrp_original_move is False:
-                    move_line._action_cancel()
-                if move_line.state in ('draft', 'cancel'):
-                    if move_line.mrp_original_move:
-                        move_line.state = move_line.mrp_original_move
-                    else:
-                        move_line.unlink()
-            for purchese in purchaseOrderObj.search([('production_external_id', '=', self.id)]):
-                purchese.button_cancel()
-                purchese.unlink()
+        stockMoveObj = self.env['stock.move']
+        stockPickList = stockPickingObj.search(['|',
+                                                ('origin', 'in', self.mapped('name')),
+                                                ('sub_production_id', 'in', self.ids)])
+        stockPickList.action_cancel()
+        moves = stockPickList.mapped('move_lines')
+        self.write({'state': 'confirmed'})
+        movesToCancel = stockMoveObj.search([('subcontracting_move_id', 'in', moves.ids)])
+        movesToCancel |= self.mapped('move_raw_ids') | self.mapped('move_finished_ids')
+        movesToCancel.filtered(lambda move_line: move_line.mrp_original_move is False)._action_cancel()
+        movesToReset = movesToCancel.filtered(lambda move_line: move_line.state in ('draft', 'cancel'))
+        for originalState in set(movesToReset.mapped('mrp_original_move')):
+            if originalState:
+                movesToReset.filtered(lambda move_line: move_line.mrp_original_move == originalState).write({'state': originalState})
+        movesToReset.filtered(lambda move_line: not move_line.mrp_original_move).unlink()
+        purchases = self.mapped('external_purchase_ids')
+        purchases.button_cancel()
+        purchases.unlink()
 
     def checkCreateReorderRule(self, prodBrws, warehouse):
         if warehouse:
@@ -347,33 +366,45 @@ class MrpProduction(models.Model):
 
     @api.multi
     def do_cancel_external_move(self):
-        for mrp_production in self:
-            for move in mrp_production.move_raw_ids:
-                if move.state not in ['done', 'cancel']:
-                    logging.info("Unreserve Move %r" % move.name)
-                    move._action_cancel()
-            for move in mrp_production.finished_move_line_ids:
-                if move.state not in ['done', 'cancel']:
-                    move.unlink()
+        moves = self.mapped('move_raw_ids').filtered(lambda move: move.state not in ['done', 'cancel'])
+        logging.info("Unreserve %r moves" % len(moves))
+        moves._action_cancel()
+        self.mapped('finished_move_line_ids').filtered(lambda move: move.state not in ['done', 'cancel']).unlink()
 
     @api.model
-    def unreservePlanned(self):
-        error = []
-        for mrp_production in self.search([('state', 'in', ['external'])]):
-            try:
-                logging.info("Unreserve from production %r in state %r" % (mrp_production.name, mrp_production.state))
-                mrp_production.button_unreserve()
-                if mrp_production.state == 'external':
-                    mrp_production.do_cancel_external_move()
-            except Exception as ex:
-                error.append("Manufactory %r Error %r " % (mrp_production.id, ex))
-        for pick in self.env['stock.picking'].search([('external_production', '!=', False),
-                                                      ('state', 'not in', ['cancel', 'done'])]):
-            logging.info("Unreserve Pick %r" % pick.name)
-            try:
-                pick.do_unreserve()
-            except Exception as ex:
-                error.append("Unreserve pick %r Error %r " % (mrp_production.id, ex))
+    def unreservePlanned(self, batchSize=UNRESERVE_BATCH_SIZE):
+        """
+            Unreserve external productions and their pickings, called by cron.
+            Each batch is committed and the run is tracked in mrp.unreserve.log,
+            so an interrupted run goes on from the last committed batch
+        """
+        def unreserveProductions(productions):
+            logging.info("Unreserve productions %r" % productions.mapped('name'))
+            productions.button_unreserve()
+            productions.filtered(lambda production: production.state == 'external').do_cancel_external_move()
+
+        def unreservePickings(pickings):
+            logging.info("Unreserve picks %r" % pickings.mapped('name'))
+            pickings.do_unreserve()
+
+        logBrws = self.env['mrp.unreserve.log'].getRunningLog()
+        error = logBrws.processStage('production',
+                                     [('state', 'in', ['external'])],
+                                     unreserveProductions,
+                                     'productions_done',
+                                     batchSize)
+        if logBrws.stage == 'production':
+            logBrws.write({'stage': 'picking',
+                           'last_id': 0})
+            self.env.cr.commit()
+        error += logBrws.processStage('picking',
+                                      [('external_production', '!=', False),
+                                       ('state', 'not in', ['cancel', 'done'])],
+                                      unreservePickings,
+                                      'pickings_done',
+                                      batchSize)
+        logBrws.write({'state': 'done',
+                       'end_date': fields.Datetime.now()})
         return error
 
 
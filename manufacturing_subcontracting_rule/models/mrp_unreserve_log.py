@@ -0,0 +1,132 @@
+import time
+import logging
+import datetime
+
+from odoo import models
+from odoo import fields
+from odoo import api
+from odoo import _
+from odoo.addons.base.ir.ir_cron import _intervalTypes
+
+UNRESERVE_BATCH_SIZE = 100
+# Finished runs older than this are deleted
+UNRESERVE_LOG_RETENTION_DAYS = 90
+
+
+class MrpUnreserveLog(models.Model):
+    _name = 'mrp.unreserve.log'
+    _description = 'Unreserve Planned Run'
+    _order = 'id desc'
+
+    name = fields.Datetime(_('Started'), default=fields.Datetime.now, readonly=True)
+    end_date = fields.Datetime(_('Ended'), readonly=True)
+    state = fields.Selection([('running', _('Running')),
+                              ('done', _('Done')),
+                              ('abandoned', _('Abandoned'))],
+                             string=_('Status'),
+                             default='running',
+                             readonly=True)
+    stage = fields.Selection([('production', _('Productions')),
+                              ('picking', _('Pickings'))],
+                             string=_('Stage'),
+                             default='production',
+                             readonly=True,
+                             help="""Records currently unreserved""")
+    last_id = fields.Integer(_('Last Processed Id'),
+                             readonly=True,
+                             help="""Id of the last record processed in the current stage, the run resumes after it""")
+    productions_done = fields.Integer(_('Productions'), readonly=True)
+    pickings_done = fields.Integer(_('Pickings'), readonly=True)
+    errors_count = fields.Integer(_('Errors'), readonly=True)
+    error_log = fields.Text(_('Error Log'), readonly=True)
+    elapsed = fields.Float(_('Seconds'), readonly=True)
+    throughput = fields.Float(_('Records/Second'), compute='_computeThroughput')
+
+    @api.multi
+    @api.depends('productions_done', 'pickings_done', 'elapsed')
+    def _computeThroughput(self):
+        for logBrws in self:
+            if logBrws.elapsed:
+                logBrws.throughput = (logBrws.productions_done + logBrws.pickings_done) / logBrws.elapsed
+
+    @api.model
+    def getRunningLog(self):
+        """
+            Run to resume, or a new one when the running one is too old to be resumed
+        """
+        startLimit = self.getRunStartLimit()
+        for logBrws in self.search([('state', '=', 'running')]):
+            if fields.Datetime.from_string(logBrws.name) > startLimit:
+                return logBrws
+            # Interrupted and never resumed, a new run starts from the first record
+            logBrws.write({'state': 'abandoned',
+                           'end_date': fields.Datetime.now()})
+        self.vacuumLogs()
+        return self.create({})
+
+    @api.model
+    def getRunStartLimit(self):
+        """
+            Runs started before half an interval of the unreserve cron ago, one day when the cron
+            is missing, are not resumed: the next scheduled run always starts a fresh pass
+        """
+        now = datetime.datetime.utcnow()
+        cronBrws = self.env.ref('manufacturing_subcontracting_rule.ir_cron_unreserve_planned', raise_if_not_found=False)
+        if cronBrws:
+            interval = now - (now - _intervalTypes[cronBrws.interval_type](cronBrws.interval_number))
+        else:
+            interval = datetime.timedelta(days=1)
+        return now - interval / 2
+
+    @api.model
+    def vacuumLogs(self):
+        limitDate = datetime.datetime.utcnow() - datetime.timedelta(days=UNRESERVE_LOG_RETENTION_DAYS)
+        self.search([('state', '!=', 'running'),
+                     ('name', '<', fields.Datetime.to_string(limitDate))]).unlink()
+
+    @api.multi
+    def addErrors(self, errors):
+        if not errors:
+            return
+        self.write({'errors_count': self.errors_count + len(errors),
+                    'error_log': '\n'.join(filter(None, [self.error_log] + errors))})
+
+    @api.multi
+    def processStage(self, stage, domain, processBatch, counterField, batchSize=UNRESERVE_BATCH_SIZE):
+        """
+            Process the records of domain in batches of ids greater than last_id,
+            committing after each batch so that an interrupted run is resumed from there
+        """
+        if self.stage != stage:
+            return []
+        model = {'production': 'mrp.production',
+                 'picking': 'stock.picking'}[stage]
+        recordObj = self.env[model]
+        errors = []
+        while True:
+            batch = recordObj.search(domain + [('id', '>', self.last_id)], order='id', limit=batchSize)
+            if not batch:
+                break
+            startTime = time.time()
+            batchErrors = []
+            try:
+                with self.env.cr.savepoint():
+                    processBatch(batch)
+            except Exception:
+                # Find the failing records, the others are still processed
+                self.env.invalidate_all()
+                for recordBrws in batch:
+                    try:
+                        with self.env.cr.savepoint():
+                            processBatch(recordBrws)
+                    except Exception as ex:
+                        self.env.invalidate_all()
+                        batchErrors.append("%s %r Error %r " % (model, recordBrws.id, ex))
+            self.write({'last_id': batch.ids[-1],
+                        counterField: self[counterField] + len(batch),
+                        'elapsed': self.elapsed + time.time() - startTime})
+            self.addErrors(batchErrors)
+            errors.extend(batchErrors)
+            logging.info("Unreserve planned: %s %d %s done" % (stage, self[counterField], model))
+            self.env.cr.commit()
+        return errors
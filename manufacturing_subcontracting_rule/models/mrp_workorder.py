@@ -9,6 +9,7 @@ from odoo import fields
 from odoo import api
 from odoo.exceptions import UserError
 from odoo import _
+from odoo.tools.sql import column_exists
 import logging
 import datetime
 
@@ -19,6 +20,51 @@ class MrpWorkorder(models.Model):
     state = fields.Selection(selection_add=[('external', 'External Production')])
     external_product = fields.Many2one('product.product',
                                        string=_('External Product use for external production'))
+    external_picking_ids = fields.Many2many('stock.picking',
+                                            'mrp_workorder_external_picking_rel',
+                                            'workorder_id',
+                                            'picking_id',
+                                            string=_('External Pickings'),
+                                            copy=False,
+                                            readonly=True)
+    external_purchase_ids = fields.Many2many('purchase.order',
+                                             'mrp_workorder_external_purchase_rel',
+                                             'workorder_id',
+                                             'purchase_id',
+                                             string=_('External Purchases'),
+                                             copy=False,
+                                             readonly=True)
+
+    @api.model_cr
+    def init(self):
+        """
+            Link the external documents created before the links were stored,
+            see MrpProduction.init about the missing columns
+        """
+        cr = self.env.cr
+        if column_exists(cr, 'stock_picking', 'sub_workorder_id'):
+            cr.execute("""
+                INSERT INTO mrp_workorder_external_picking_rel (workorder_id, picking_id)
+                SELECT wo.id, pick.id
+                FROM stock_picking AS pick
+                JOIN mrp_workorder AS wo ON wo.id = pick.sub_workorder_id
+                ON CONFLICT DO NOTHING
+            """)
+        queries = []
+        if column_exists(cr, 'purchase_order', 'workorder_external_id'):
+            queries.append("""SELECT workorder_external_id, id
+                              FROM purchase_order
+                              WHERE workorder_external_id IS NOT NULL""")
+        if column_exists(cr, 'purchase_order_line', 'workorder_external_id'):
+            queries.append("""SELECT workorder_external_id, order_id
+                              FROM purchase_order_line
+                              WHERE workorder_external_id IS NOT NULL""")
+        if queries:
+            cr.execute("""
+                INSERT INTO mrp_workorder_external_purchase_rel (workorder_id, purchase_id)
+                %s
+                ON CONFLICT DO NOTHING
+            """ % ' UNION '.join(queries))
 
     def createTmpStockMove(self, sourceMoveObj, location_source_id=None, location_dest_id=None, unit_factor=1.0):
         tmpMoveObj = self.env["stock.tmp_move"]
@@ -85,8 +131,7 @@ class MrpWorkorder(models.Model):
             for stock_picking_id in picking_ids:
                 stock_picking_id.do_unreserve()
                 stock_picking_id.action_cancel()
-            purchase_ids = self.env['purchase.order'].search([('workorder_external_id', '=', mrp_workorder_id.id)])
-            for purchase in purchase_ids:
+            for purchase in mrp_workorder_id.external_purchase_ids:
                 purchase.button_cancel()
                 purchase.unlink()
             mrp_workorder_id.write({'state': 'ready'})
@@ -115,12 +160,7 @@ class MrpWorkorder(models.Model):
     def button_finish(self):
         res = super(MrpWorkorder, self).button_finish()
         production_id = self.production_id
-        isExternal = False
-        for relatedWO in self.search([('production_id', '=', production_id.id)]):
-            # Check if external workorder
-            if relatedWO.getExternalPickings():
-                isExternal = True
-                break
+        isExternal = bool(production_id.workorder_ids.mapped('external_picking_ids'))
         if not self.next_work_order_id and isExternal:
             # Close manufacturing order
             production_id.write({'state': 'done', 'date_finished': fields.Datetime.now()})
@@ -128,10 +168,7 @@ class MrpWorkorder(models.Model):
 
     @api.multi
     def getExternalPickings(self):
-        pickObj = self.env['stock.picking']
-        for woBrws in self:
-            return pickObj.search([('sub_workorder_id', '=', woBrws.id)])
-        return pickObj
+        return self.mapped('external_picking_ids')
 
     @api.multi
     def open_external_pickings(self):
@@ -150,9 +187,7 @@ class MrpWorkorder(models.Model):
     @api.multi
     def open_external_purchase(self):
         newContext = self.env.context.copy()
-        picks = self.env['purchase.order']
-        for woBrws in self:
-            picks = picks.search([('workorder_external_id', '=', woBrws.id)])
+        picks = self.mapped('external_purchase_ids')
         return {
             'name': _("External Pickings"),
             'view_type': 'form',
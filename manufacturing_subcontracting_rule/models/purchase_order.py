@@ -45,6 +45,54 @@ class PurchaseOrder(models.Model):
     production_external_id = fields.Many2one('mrp.production', string=_('External Production'))
     workorder_external_id = fields.Many2one('mrp.workorder', string=_('External Workorder'))
 
+    @api.model
+    def create(self, vals):
+        res = super(PurchaseOrder, self).create(vals)
+        res.linkExternalDocuments(res.production_external_id, res.workorder_external_id)
+        return res
+
+    @api.multi
+    def write(self, vals):
+        relink = 'production_external_id' in vals or 'workorder_external_id' in vals
+        if relink:
+            previous = dict((purchaseBrws.id, (purchaseBrws.production_external_id, purchaseBrws.workorder_external_id))
+                            for purchaseBrws in self)
+        res = super(PurchaseOrder, self).write(vals)
+        if relink:
+            for purchaseBrws in self:
+                purchaseBrws.unlinkExternalDocuments(*previous[purchaseBrws.id])
+                purchaseBrws.linkExternalDocuments(purchaseBrws.production_external_id, purchaseBrws.workorder_external_id)
+        return res
+
+    @api.multi
+    def linkExternalDocuments(self, productionBrws, workorderBrws):
+        """
+            Keep the stored links used by the production and workorder smart buttons.
+            Links are written as superuser, here and by the other link methods,
+            because purchase and warehouse users may lack MRP rights
+        """
+        for originBrws in (productionBrws, workorderBrws):
+            if not originBrws:
+                continue
+            originBrws = originBrws.sudo()
+            # Lines of an already linked order do not write again
+            toLink = self - originBrws.external_purchase_ids
+            if toLink:
+                originBrws.write({'external_purchase_ids': [(4, purchaseId) for purchaseId in toLink.ids]})
+
+    @api.multi
+    def unlinkExternalDocuments(self, productionBrws, workorderBrws):
+        """
+            Remove the links to productionBrws and workorderBrws not referenced anymore
+            by the orders or by their lines
+        """
+        for purchaseBrws in self:
+            for fieldName, originBrws in (('production_external_id', productionBrws),
+                                          ('workorder_external_id', workorderBrws)):
+                toUnlink = originBrws - purchaseBrws[fieldName] - purchaseBrws.order_line.mapped(fieldName)
+                if toUnlink:
+                    toUnlink.sudo().write({'external_purchase_ids': [(3, purchaseBrws.id)]})
+
     @api.multi
     def open_external_manufacturing(self):
         newContext = self.env.context.copy()
@@ -41,12 +41,82 @@ class PurchaseOrderLine(models.Model):
     workorder_external_id = fields.Many2one('mrp.workorder', string=_('External Workorder'))
     sub_move_line = fields.Many2one('stock.move', string=_('Subcontracting move ref'))
 
+    @api.model
+    def create(self, vals):
+        res = super(PurchaseOrderLine, self).create(vals)
+        res.order_id.linkExternalDocuments(res.production_external_id, res.workorder_external_id)
+        return res
+
+    @api.multi
+    def write(self, vals):
+        relink = 'production_external_id' in vals or 'workorder_external_id' in vals or 'order_id' in vals
+        if relink:
+            previous = [(lineBrws.order_id, lineBrws.production_external_id, lineBrws.workorder_external_id)
+                        for lineBrws in self]
+        res = super(PurchaseOrderLine, self).write(vals)
+        if relink:
+            for orderBrws, productionBrws, workorderBrws in previous:
+                orderBrws.unlinkExternalDocuments(productionBrws, workorderBrws)
+            for lineBrws in self:
+                lineBrws.order_id.linkExternalDocuments(lineBrws.production_external_id, lineBrws.workorder_external_id)
+        return res
+
+    @api.multi
+    def unlink(self):
+        previous = [(lineBrws.order_id, lineBrws.production_external_id, lineBrws.workorder_external_id)
+                    for lineBrws in self if lineBrws.production_external_id or lineBrws.workorder_external_id]
+        res = super(PurchaseOrderLine, self).unlink()
+        for orderBrws, productionBrws, workorderBrws in previous:
+            orderBrws.exists().unlinkExternalDocuments(productionBrws, workorderBrws)
+        return res
+
+    @api.model
+    def getExternalReceivedQty(self, workorderIds, productionIds):
+        """
+            Done incoming quantities of the external pickings of workorders and productions
+            return: (received, withPickings)
+                received: {('workorder' or 'production', id): {product_id: [(product_uom, qty)]}}
+                withPickings: keys of the ones having at least one external picking
+        """
+        received = {}
+        withPickings = set()
+        if not workorderIds and not productionIds:
+            return received, withPickings
+        self.env.cr.execute("""
+            SELECT sub_workorder_id, external_production
+            FROM stock_picking
+            WHERE sub_workorder_id = ANY(%s) OR external_production = ANY(%s)
+            GROUP BY sub_workorder_id, external_production
+        """, (list(workorderIds), list(productionIds)))
+        for workorderId, productionId in self.env.cr.fetchall():
+            withPickings.add(('workorder', workorderId))
+            withPickings.add(('production', productionId))
+        self.env.cr.execute("""
+            SELECT picking.sub_workorder_id, picking.external_production,
+                   move.product_id, move.product_uom, SUM(move.product_uom_qty)
+            FROM stock_move move
+            JOIN stock_picking picking ON picking.id = move.picking_id
+            JOIN stock_picking_type picking_type ON picking_type.id = picking.picking_type_id
+            WHERE move.state = 'done'
+                AND picking_type.code = 'incoming'
+                AND (picking.sub_workorder_id = ANY(%s) OR picking.external_production = ANY(%s))
+            GROUP BY picking.sub_workorder_id, picking.external_production, move.product_id, move.product_uom
+        """, (list(workorderIds), list(productionIds)))
+        for workorderId, productionId, productId, uomId, qty in self.env.cr.fetchall():
+            for key in (('workorder', workorderId), ('production', productionId)):
+                received.setdefault(key, {}).setdefault(productId, []).append((uomId, qty))
+        return received, withPickings
+
     @api.depends('order_id.state', 'move_ids.state')
     def _compute_qty_received(self):
         super(PurchaseOrderLine, self)._compute_qty_received()
+        received, withPickings = self.getExternalReceivedQty(self.mapped('workorder_external_id').ids,
+                                                             self.mapped('production_external_id').ids)
+        uomObj = self.env['product.uom']
         for line in self:
             prod_to_produce = self.env['product.product']
             s_product = self.env['product.product']
+            key = False
             if line.workorder_external_id:
                 operation = line.workorder_external_id.operation_id.external_operation
                 if operation == 'operation':
@@ -56,24 +126,19 @@ class PurchaseOrderLine(models.Model):
                 else:  # suppose normal
                     prod_to_produce = line.workorder_external_id.product_id
                 s_product = line.workorder_external_id.external_product
-                external_picks = line.workorder_external_id.getExternalPickings()
+                key = ('workorder', line.workorder_external_id.id)
             elif line.production_external_id:
                 prod_to_produce = line.production_external_id.product_id
                 bom = line.production_external_id.bom_id
                 if bom:
                     s_product = bom.external_product
-                external_picks = line.production_external_id.external_pickings
-            if prod_to_produce and s_product and external_picks:
+                key = ('production', line.production_external_id.id)
+            if prod_to_produce and s_product and key in withPickings:
                 deliver_qty = 0
                 if s_product == line.product_id:
-                    for pick in external_picks:
-                        if pick.isIncoming(pick):
-                            for move in pick.move_lines:
-                                if move.product_id == prod_to_produce:
-                                    if move.state == 'done':
-                                        if move.product_uom != line.product_uom:
-                                            deliver_qty += move.product_uom._compute_quantity(move.product_uom_qty, line.product_uom)
-                                        else:
-                                            deliver_qty += move.product_uom_qty
+                    for uomId, qty in received.get(key, {}).get(prod_to_produce.id, []):
+                        if uomId != line.product_uom.id:
+                            deliver_qty += uomObj.browse(uomId)._compute_quantity(qty, line.product_uom)
+                        else:
+                            deliver_qty += qty
                 line.qty_received = deliver_qty
-
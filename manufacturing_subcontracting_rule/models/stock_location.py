@@ -7,17 +7,97 @@ Created on 3 Sep 2018
 from odoo import models
 from odoo import fields
 from odoo import api
+from odoo import tools
 from odoo import _
 import logging
 import datetime
 
+# Changing these fields may change the locations returned by the cached getters
+LOCATION_CACHE_FIELDS = ['name', 'usage', 'active', 'company_id', 'location_id']
+
 
 class StockLocation(models.Model):
     _inherit = ['stock.location']
 
+    @api.model
+    def create(self, vals):
+        res = super(StockLocation, self).create(vals)
+        self.clear_caches()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockLocation, self).write(vals)
+        if set(vals.keys()).intersection(LOCATION_CACHE_FIELDS):
+            self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(StockLocation, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    def _getExistingCachedId(self, getter, *args):
+        """
+            Id returned by the cached getter, searched again if its record does not exist anymore,
+            as when it was cached by a transaction rolled back afterwards
+        """
+        recordId = getter(*args)
+        if recordId and not self.browse(recordId).exists():
+            self.clear_caches()
+            recordId = getter(*args)
+        return recordId
+
+    @api.model
+    @tools.ormcache('companyId')
+    def _getSubcontractingLocationId(self, companyId):
+        for stock_location in self.sudo().search([('name', '=', 'Subcontracting'),
+                                                  ('company_id', 'in', [companyId, False])]):
+            return stock_location.id
+        return False
+
     @api.model
     def getSubcontractiongLocation(self):
-        for stock_location in self.search([('name', '=', 'Subcontracting')]):
-            return stock_location
-        return self.create({'usage': 'production',
-                            'name': 'Subcontracting'})
+        locationId = self._getExistingCachedId(self._getSubcontractingLocationId, self.env.user.company_id.id)
+        if locationId:
+            return self.browse(locationId)
+        # Only searches are cached, the location created here is found by the next call
+        location = self.create({'usage': 'production',
+                                'name': 'Subcontracting'})
+        self.clear_caches()
+        return location
+
+    @api.model
+    @tools.ormcache()
+    def _getSupplierLocationId(self):
+        for lock in self.sudo().search([('usage', '=', 'supplier'),
+                                        ('active', '=', True),
+                                        ('company_id', '=', False)]):
+            return lock.id
+        return False
+
+    @api.model
+    def getSupplierLocationId(self):
+        """
+            Shared supplier location, cached until locations are changed
+        """
+        return self._getExistingCachedId(self._getSupplierLocationId)
+
+    @api.model
+    @tools.ormcache('companyId')
+    def _getVendorsLocationId(self, companyId):
+        locations = self.sudo().with_context(lang='en_US').search([('usage', '=', 'supplier'),
+                                                                  ('name', '=', 'Vendors'),
+                                                                  ('company_id', 'in', [companyId, False])])
+        if locations:
+            return locations[-1].id
+        return False
+
+    @api.model
+    def getVendorsLocation(self):
+        """
+            Vendors location, parent of the partner production locations
+        """
+        return self.browse(self._getExistingCachedId(self._getVendorsLocationId, self.env.user.company_id.id))
@@ -51,7 +51,7 @@ class StockMove(models.Model):
     mrp_workorder_id = fields.Integer(string=_('Original Mrp Work Order id'),
                                       help="""source Mrp Workorder Subcontracting id""")
     purchase_order_line_subcontracting_id = fields.Integer(_('Original Purchase line Id'))
-    subcontracting_source_stock_move_id = fields.Integer(_('Original Production ID'))
+    subcontracting_source_stock_move_id = fields.Integer(_('Original Production ID'), index=True)
     subcontracting_move_id = fields.Integer(_('Original move id'))
 
     @api.model
@@ -148,10 +148,20 @@ class StockMove(models.Model):
         production_move.date = move_date
         return production_move
 
+    @api.multi
+    def getSubcontractingSubMoves(self):
+        """
+            Moves generated by subContractingProduce from these moves
+        """
+        if not self.ids:
+            return self.browse()
+        return self.search([('subcontracting_source_stock_move_id', 'in', self.ids)])
+
     @api.multi
     def write(self, value):
-        for move in self:
-            if 'quantity_done' in list(value.keys()):
-                for subMove in self.search([('subcontracting_source_stock_move_id', '=', move.id)]):
-                    subMove.quantity_done = value['quantity_done']
+        if 'quantity_done' in value:
+            # Only quantity_done is propagated, one search for all the written moves
+            subMoves = self.getSubcontractingSubMoves()
+            if subMoves:
+                subMoves.write({'quantity_done': value['quantity_done']})
         return super(StockMove, self).write(value)
@@ -40,13 +40,46 @@ from odoo import _
 class StockPicking(models.Model):
     _inherit = 'stock.picking'
 
-    external_production = fields.Many2one('mrp.production')
+    external_production = fields.Many2one('mrp.production', index=True)
     pick_out = fields.Many2one('stock.picking', string=_('Reference Stock pick out'))
     sub_contracting_operation = fields.Selection([('open', _('Open external Production')),
                                                   ('close', _('Close external Production'))])
     sub_production_id = fields.Integer(string=_('Sub production Id'))
     sub_workorder_id = fields.Integer(string=_('Sub Workorder Id'))
 
+    @api.model
+    def create(self, vals):
+        res = super(StockPicking, self).create(vals)
+        # Backorders copy sub_workorder_id, so they get linked too
+        res.linkExternalWorkorder()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        relink = 'sub_workorder_id' in vals
+        if relink:
+            previous = dict((pickBrws.id, pickBrws.sub_workorder_id) for pickBrws in self)
+        res = super(StockPicking, self).write(vals)
+        if relink:
+            workorderObj = self.env['mrp.workorder'].sudo()
+            for pickBrws in self:
+                if previous[pickBrws.id] and previous[pickBrws.id] != pickBrws.sub_workorder_id:
+                    workorderBrws = workorderObj.browse(previous[pickBrws.id]).exists()
+                    workorderBrws.write({'external_picking_ids': [(3, pickBrws.id)]})
+            self.linkExternalWorkorder()
+        return res
+
+    @api.multi
+    def linkExternalWorkorder(self):
+        """
+            Keep the stored links used by the workorder smart buttons, see PurchaseOrder.linkExternalDocuments
+        """
+        workorderObj = self.env['mrp.workorder'].sudo()
+        for pickBrws in self:
+            if pickBrws.sub_workorder_id:
+                workorderBrws = workorderObj.browse(pickBrws.sub_workorder_id).exists()
+                workorderBrws.write({'external_picking_ids': [(4, pickBrws.id)]})
+
     def isIncoming(self, objPick=None):
         if objPick is None:
             objPick = self
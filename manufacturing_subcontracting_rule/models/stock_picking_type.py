@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Copyright (c) 2018 Omniasolutions (http://www.omniasolutions.eu)
+#    All Right Reserved
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from odoo import models
+from odoo import api
+from odoo import tools
+
+# Changing these fields may change the picking type returned by getPickingTypeId
+PICKING_TYPE_CACHE_FIELDS = ['code', 'active', 'warehouse_id', 'sequence']
+
+
+class StockPickingType(models.Model):
+    _inherit = 'stock.picking.type'
+
+    @api.model
+    def create(self, vals):
+        res = super(StockPickingType, self).create(vals)
+        self.clear_caches()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockPickingType, self).write(vals)
+        if set(vals.keys()).intersection(PICKING_TYPE_CACHE_FIELDS):
+            self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(StockPickingType, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    @tools.ormcache('code', 'warehouseId')
+    def _getPickingTypeId(self, code, warehouseId):
+        for pick in self.sudo().search([('code', '=', code),
+                                        ('active', '=', True),
+                                        ('warehouse_id', '=', warehouseId)]):
+            return pick.id
+        return False
+
+    @api.model
+    def getPickingTypeId(self, code, warehouseId):
+        """
+            First active picking type of the warehouse with the given code ('incoming', 'outgoing')
+        """
+        pickingTypeId = self._getPickingTypeId(code, warehouseId)
+        if pickingTypeId and not self.browse(pickingTypeId).exists():
+            # Cached by a transaction rolled back afterwards
+            self.clear_caches()
+            pickingTypeId = self._getPickingTypeId(code, warehouseId)
+        return pickingTypeId
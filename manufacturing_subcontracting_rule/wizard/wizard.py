@@ -236,9 +236,10 @@ class MrpProductionWizard(models.TransientModel):
         return relObj.browse(objIds)
 
     def cancelProductionRows(self, prodObj):
-        for lineBrws in prodObj.move_raw_ids + prodObj.move_finished_ids:
-            lineBrws.mrp_original_move = lineBrws.state
-            lineBrws._action_cancel()
+        lines = prodObj.move_raw_ids + prodObj.move_finished_ids
+        for state in set(lines.mapped('state')):
+            lines.filtered(lambda line: line.state == state).write({'mrp_original_move': state})
+        lines._action_cancel()
 
     def updateMoveLines(self, productionBrws):
         move_raw_ids = []
@@ -370,8 +371,8 @@ class MrpProductionWizard(models.TransientModel):
                 new_purchase_order_line.onchange_product_id()
                 new_purchase_order_line.date_planned = self.request_date
                 new_purchase_order_line.product_qty = lineBrws.product_uom_qty
-                lineBrws.purchase_order_line_subcontracting_id = new_purchase_order_line.id
-                lineBrws.purchase_line_id = new_purchase_order_line
+                lineBrws.write({'purchase_order_line_subcontracting_id': new_purchase_order_line.id,
+                                'purchase_line_id': new_purchase_order_line.id})
         if self.confirm_purchese_order:
             obj_po.button_confirm()
 
@@ -487,12 +488,7 @@ class MrpProductionWizard(models.TransientModel):
 
         def getPickingType():
             warehouseId = productionBrws.picking_type_id.warehouse_id.id
-            pickTypeObj = self.env['stock.picking.type']
-            for pick in pickTypeObj.search([('code', '=', 'incoming'),
-                                            ('active', '=', True),
-                                            ('warehouse_id', '=', warehouseId)]):
-                return pick.id
-            return False
+            return self.env['stock.picking.type'].getPickingTypeId('incoming', warehouseId)
 
         isWorkorder = False
         if originBrw:
@@ -524,16 +520,16 @@ class MrpProductionWizard(models.TransientModel):
                                      partner_id,
                                      localStockLocation,
                                      customerProductionLocation)
-        out_stock_picking_id = stock_piking.create(toCreate)
         newStockLines = []
+        movesToCancel = self.env['stock.move']
         if isWorkorder:
             for stock_move_id in self.move_finished_ids:
                 vals = {'name': stock_move_id.name,
                         'company_id': stock_move_id.company_id.id,
                         'product_id': stock_move_id.product_id.id,
                         'product_uom_qty': stock_move_id.product_uom_qty,
-                        'location_id': stock_move_id.location_id.id,
-                        'location_dest_id': stock_move_id.location_dest_id.id,
+                        'location_id': customerProductionLocation.id,
+                        'location_dest_id': localStockLocation.id,
                         'note': stock_move_id.note,
                         'state': 'draft',
                         'origin': stock_move_id.origin,
@@ -545,37 +541,31 @@ class MrpProductionWizard(models.TransientModel):
                         'workorder_id': originBrw.id if isWorkorder else stock_move_id.workorder_id.id,
                         'unit_factor': stock_move_id.unit_factor,
                         'raw_material_production_id': False}
-                new_stock_move_id = self.env['stock.move'].create(vals)
-                new_stock_move_id.location_id = customerProductionLocation.id
-                new_stock_move_id.location_dest_id = localStockLocation.id
-                newStockLines.append(new_stock_move_id.id)
+                newStockLines.append((0, False, vals))
 #             for outGoingMove in incomingMoves:
 #                 outGoingMove._action_cancel()
         else:
             for stock_move_id in incomingMoves:
-                new_stock_move_id = stock_move_id.copy(default={'name': stock_move_id.product_id.display_name,
-                                                                'location_id': customerProductionLocation.id,
-                                                                'location_dest_id': localStockLocation.id,
-                                                                'sale_line_id': stock_move_id.sale_line_id,
-                                                                'production_id': False,
-                                                                'mrp_workorder_id': originBrw.id if isWorkorder else self.workorder_id.id,
-                                                                'raw_material_production_id': False,
-                                                                'picking_id': out_stock_picking_id.id})
-                newStockLines.append(new_stock_move_id.id)
-                stock_move_id._action_cancel()
+                vals = stock_move_id.copy_data(default={'name': stock_move_id.product_id.display_name,
+                                                        'location_id': customerProductionLocation.id,
+                                                        'location_dest_id': localStockLocation.id,
+                                                        'sale_line_id': stock_move_id.sale_line_id.id,
+                                                        'production_id': False,
+                                                        'mrp_workorder_id': originBrw.id if isWorkorder else self.workorder_id.id,
+                                                        'raw_material_production_id': False})[0]
+                newStockLines.append((0, False, vals))
+                movesToCancel += stock_move_id
+        # Picking and moves are created together, moves already in their final locations
+        toCreate['move_lines'] = newStockLines
+        out_stock_picking_id = stock_piking.create(toCreate)
+        movesToCancel._action_cancel()
         productionBrws.createStockMoveBom()
-        out_stock_picking_id.write({'move_lines': [(6, False, newStockLines)]})
         return out_stock_picking_id
 
     def createStockPickingOut(self, partner_id, mrp_production_id, originBrw=None, is_some_product=False):
         def getPickingType():
             warehouseId = mrp_production_id.picking_type_id.warehouse_id.id
-            stock_picking_type = self.env['stock.picking.type']
-            for stock_picking_type_id in stock_picking_type.search([('code', '=', 'outgoing'),
-                                                                    ('active', '=', True),
-                                                                    ('warehouse_id', '=', warehouseId)]):
-                return stock_picking_type_id.id
-            return False
+            return self.env['stock.picking.type'].getPickingTypeId('outgoing', warehouseId)
 
         stock_picking = self.env['stock.picking']
         if not self.move_raw_ids:
@@ -584,7 +574,7 @@ class MrpProductionWizard(models.TransientModel):
         if not customerProductionLocation:
             raise UserError(_('Partner %s has not location setup.' % (partner_id.name)))
         stock_location_id = mrp_production_id.location_src_id  # Taken from manufacturing order
-        out_stock_move_ids = []
+        out_stock_move_ids = self.env['stock.move']
         isWorkorder = False
         if originBrw:
             isWorkorder = True
@@ -596,7 +586,7 @@ class MrpProductionWizard(models.TransientModel):
             if not customerProductionLocation:
                 customerProductionLocation = stock_move_id.location_dest_id
             if stock_move_id.state not in ['done', 'cancel']:  # and stock_move_id.partner_id == partner_id:
-                out_stock_move_ids.append(stock_move_id)
+                out_stock_move_ids += stock_move_id
         toCreate = {'partner_id': partner_id.id,
                     'location_id': stock_location_id.id,
                     'location_dest_id': customerProductionLocation.id,
@@ -614,20 +604,18 @@ class MrpProductionWizard(models.TransientModel):
                                       partner_id,
                                       stock_location_id,
                                       customerProductionLocation)
-        out_stock_picking_id = stock_picking.create(toCreate)
-        new_stock_move_line_ids = []
+        new_stock_move_lines = []
         if isWorkorder:
             raw_moves = self.move_raw_ids
             if is_some_product:
                 raw_moves = self.move_finished_ids
             for tmpRow in raw_moves:
-                tmpRow
                 vals = {'name': tmpRow.name,
                         'company_id': tmpRow.company_id.id,
                         'product_id': tmpRow.product_id.id,
                         'product_uom_qty': tmpRow.product_uom_qty,
-                        'location_id': tmpRow.location_id.id,
-                        'location_dest_id': tmpRow.location_dest_id.id,
+                        'location_id': stock_location_id.id,
+                        'location_dest_id': customerProductionLocation.id,
                         'note': tmpRow.note,
                         'state': 'draft',
                         'origin': tmpRow.origin,
@@ -640,25 +628,23 @@ class MrpProductionWizard(models.TransientModel):
                         'unit_factor': tmpRow.unit_factor,
                         'external_prod_workorder_finish': False,
                         'raw_material_production_id': False}
-                new_stock_move_id = self.env['stock.move'].create(vals)
-                new_stock_move_id.location_id = stock_location_id.id
-                new_stock_move_id.location_dest_id = customerProductionLocation.id
-                new_stock_move_line_ids.append(new_stock_move_id.id)
-            if not is_some_product:
-                for outGoingMove in out_stock_move_ids:
-                    outGoingMove._action_cancel()
+                new_stock_move_lines.append((0, False, vals))
         else:
             for stock_move_id in out_stock_move_ids:
-                new_stock_move_id = stock_move_id.copy(default={'name': stock_move_id.product_id.display_name,
-                                                                'production_id': False,
-                                                                'mrp_workorder_id': self.workorder_id.id,
-                                                                'raw_material_production_id': False,
-                                                                'unit_factor': stock_move_id.unit_factor})
-                new_stock_move_id.location_id = stock_location_id.id
-                new_stock_move_id.location_dest_id = customerProductionLocation.id
-                new_stock_move_id.sale_line_id = stock_move_id.sale_line_id.id
-                new_stock_move_line_ids.append(new_stock_move_id.id)
-        out_stock_picking_id.write({'move_lines': [(6, False, new_stock_move_line_ids)]})
+                vals = stock_move_id.copy_data(default={'name': stock_move_id.product_id.display_name,
+                                                        'production_id': False,
+                                                        'mrp_workorder_id': self.workorder_id.id,
+                                                        'raw_material_production_id': False,
+                                                        'unit_factor': stock_move_id.unit_factor,
+                                                        'location_id': stock_location_id.id,
+                                                        'location_dest_id': customerProductionLocation.id,
+                                                        'sale_line_id': stock_move_id.sale_line_id.id})[0]
+                new_stock_move_lines.append((0, False, vals))
+        # Picking and moves are created together, moves already in their final locations
+        toCreate['move_lines'] = new_stock_move_lines
+        out_stock_picking_id = stock_picking.create(toCreate)
+        if isWorkorder and not is_some_product:
+            out_stock_move_ids._action_cancel()
         return out_stock_picking_id
 
     @api.multi
@@ -749,12 +735,7 @@ class MrpWorkorderWizard(MrpProductionWizard):
                                     picking_type_str):
         def getPickingType():
             warehouseId = mrp_production_id.picking_type_id.warehouse_id.id
-            pickTypeObj = self.env['stock.picking.type']
-            for pick in pickTypeObj.search([('code', '=', picking_type_str),  # 'incoming', 'outgoing'
-                                            ('active', '=', True),
-                                            ('warehouse_id', '=', warehouseId)]):
-                return pick.id
-            return False
+            return self.env['stock.picking.type'].getPickingTypeId(picking_type_str, warehouseId)  # 'incoming', 'outgoing'
 
         toCreate = {'partner_id': partner_id.id,
                     'location_id': location_id.id,
@@ -778,8 +759,7 @@ class MrpWorkorderWizard(MrpProductionWizard):
                                          partner_id,
                                          location_id,
                                          location_dest_id)
-        out_stock_picking_id = self.env['stock.picking'].create(toCreate)
-        new_stock_move_line_ids = []
+        new_stock_move_lines = []
         for bom_line_id in products:
             vals = {'name': '',
                     'company_id': mrp_production_id.company_id.id,
@@ -798,12 +778,10 @@ class MrpWorkorderWizard(MrpProductionWizard):
                     'unit_factor': 1,
                     'external_prod_workorder_finish': False,
                     'raw_material_production_id': False}
-            new_stock_move_id = self.env['stock.move'].create(vals)
-            new_stock_move_id.location_id = location_id.id
-            new_stock_move_id.location_dest_id = location_dest_id.id
-            new_stock_move_line_ids.append(new_stock_move_id.id)
-        out_stock_picking_id.write({'move_lines': [(6, False, new_stock_move_line_ids)]})
-        return out_stock_picking_id
+            new_stock_move_lines.append((0, False, vals))
+        # Picking and moves are created together
+        toCreate['move_lines'] = new_stock_move_lines
+        return self.env['stock.picking'].create(toCreate)
 
     @api.model
     def getWorkorderProductsByOperation(self, mrp_production_id, mrp_workorder_id):
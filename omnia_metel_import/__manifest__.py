@@ -36,7 +36,9 @@ Import purchase pricelists from Metel
     'website': 'http://www.OmniaSolutions.eu',
     'depends': ['purchase'],
     'data': [
+            'security/ir.model.access.csv',
             'views/supplier_info.xml',
+            'data/ir_cron.xml',
              ],
     'installable': True,
     'application': False,
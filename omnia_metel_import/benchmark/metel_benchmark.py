@@ -0,0 +1,274 @@
+# -*- encoding: utf-8 -*-
+##############################################################################
+#
+#    OmniaSolutions, Your own solutions
+#    Copyright (C) 2010-2018 OmniaSolutions (<http://omniasolutions.eu>). All Rights Reserved
+#    $Id$
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+'''
+Throughput benchmark of omnia_metel_import.
+
+Synthetic Metel files are generated following metel_listino and metel_prodotto
+and parse, stage, match and create stages are timed separately, reporting
+records/second of each stage.
+
+With memory tracing on, the peak of the Python memory traced by tracemalloc
+during each stage is reported too. Tracing slows every allocation down, so
+run throughput and memory measures separately. Memory of the pre-parse
+processes is not traced.
+
+Only the parse stages can run without a database, --processes also times the
+parallel pre-parse done for big files with that number of processes:
+
+    python metel_benchmark.py --records 300000 --processes 8
+    python metel_benchmark.py --records 300000 --trace-memory
+
+All the stages run from an odoo shell, everything is rolled back at the end:
+
+    from odoo.addons.omnia_metel_import.benchmark import metel_benchmark
+    metel_benchmark.runBenchmark(env, records=300000, knownProducts=1000)
+'''
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+import datetime
+import argparse
+
+try:
+    from odoo.addons.omnia_metel_import.models import metel_parser
+    from odoo.addons.omnia_metel_import.models import metel_preparse
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+    import metel_parser
+    import metel_preparse
+
+BENCHMARK_VAT = '09999999999'
+BARCODE_PREFIX = '299'
+
+
+def formatRecord(mapping, values):
+    """
+        Place values (field name -> str) in a fixed width record following mapping
+    """
+    size = max(start + lenght for start, lenght in mapping.values())
+    record = bytearray(b' ' * size)
+    for fieldName, value in values.items():
+        start, lenght = mapping[fieldName]
+        raw = value.encode('utf-8')[:lenght]
+        record[start:start + len(raw)] = raw
+    return bytes(record)
+
+
+def getBarcode(index):
+    return '%s%010d' % (BARCODE_PREFIX, index)
+
+
+def generateHeader(vat=BENCHMARK_VAT, date=None):
+    date = (date or datetime.date.today()).strftime('%Y%m%d')
+    return formatRecord(metel_parser.metel_listino, {'identificazione': 'LISTINO METEL',
+                                                     'azienda': 'BEN',
+                                                     'partita_iva': vat,
+                                                     'listino': 'BENCH',
+                                                     'data_decorrenza_pubblico': date,
+                                                     'data_variazione': date,
+                                                     'descrizione': 'Benchmark pricelist',
+                                                     'verifica': '020',
+                                                     'data_decorrenza_grossista': date})
+
+
+def generateRecord(index, rnd, date):
+    price = rnd.randint(1, 9999999)
+    return formatRecord(metel_parser.metel_prodotto, {'marchio_produttore': 'BEN',
+                                                      'codice_prodotto': 'BEN%013d' % (index),
+                                                      'ean13': getBarcode(index),
+                                                      'descrizione': 'Benchmark product %d' % (index),
+                                                      'qta_in_cartone': '%05d' % (rnd.randint(1, 100)),
+                                                      'qta_multipla_ordine': '00001',
+                                                      'qta_minima_ordine': '%05d' % (rnd.randint(1, 10)),
+                                                      'qta_massima_ordine': '000000',
+                                                      'lead_time': rnd.choice('0123456789ABCDEF'),
+                                                      'prezzo_al_grossista': '%011d' % (price),
+                                                      'prezzo_al_pubblico': '%011d' % (price * 2),
+                                                      'moltiplicatore_prezzo': '000001',
+                                                      'codice_valuta': 'EUR',
+                                                      'unita_misura': 'PCE',
+                                                      'prodotto_composto': '0',
+                                                      'stato_prodotto': '3',
+                                                      'data_ultima_variazione_var': date,
+                                                      'famiglia_di_sconto': 'BENCH',
+                                                      'famiglia_statistica': 'BENCH%d' % (index % 100)})
+
+
+def generateMetelFile(records, vat=BENCHMARK_VAT, seed=0):
+    """
+        Return the content of a valid Metel file with records products
+    """
+    rnd = random.Random(seed)
+    date = (datetime.date.today() - datetime.timedelta(days=30)).strftime('%Y%m%d')
+    lines = [generateHeader(vat)]
+    for index in range(records):
+        lines.append(generateRecord(index, rnd, date))
+    lines.append(b'')
+    return b'\r\n'.join(lines)
+
+
+def resetPeakMemory():
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        # Before Python 3.9 the peak is reset restarting the trace
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+def timeStage(results, name, records, function, *args):
+    """
+        Run function(*args) as the stage name, tracing its peak memory when tracemalloc is tracing
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        resetPeakMemory()
+    startTime = time.time()
+    out = function(*args)
+    elapsed = time.time() - startTime
+    results.append({'stage': name,
+                    'records': records,
+                    'seconds': elapsed,
+                    'records_second': records / elapsed if elapsed else 0.0,
+                    'peak_memory_mb': tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0) if tracing else None})
+    return out
+
+
+def printResults(results):
+    print('%-8s %10s %10s %12s %16s' % ('stage', 'records', 'seconds', 'records/s', 'peak traced (MB)'))
+    for result in results:
+        peak = '%16.1f' % (result['peak_memory_mb']) if result['peak_memory_mb'] is not None else '%16s' % ('-')
+        print('%-8s %10d %10.2f %12.0f %s' % (result['stage'],
+                                              result['records'],
+                                              result['seconds'],
+                                              result['records_second'],
+                                              peak))
+
+
+def parseStage(fileContent):
+    headerLength = metel_parser.getLineLength(fileContent)
+    layout = metel_parser.getLayout(metel_parser.metel_prodotto)
+    counter = 0
+    for _record in layout.iterRecords(fileContent, headerLength):
+        counter += 1
+    return counter
+
+
+def preparseStage(fileContent, processes):
+    outDir = tempfile.mkdtemp(prefix='metel_benchmark_')
+    try:
+        filePath = os.path.join(outDir, 'METEL.TXT')
+        with open(filePath, 'wb') as fileObj:
+            fileObj.write(fileContent)
+        result = metel_preparse.runPreparse({'filePath': filePath,
+                                             'start': metel_parser.getLineLength(fileContent),
+                                             'end': len(fileContent),
+                                             'processes': processes,
+                                             'outDir': outDir,
+                                             'currencies': {'EUR': 1},
+                                             'uoms': {'PCE': 1},
+                                             'validityDate': datetime.date.today().isoformat(),
+                                             'wizardId': 1,
+                                             'uid': 1,
+                                             'now': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')})
+        return result['records']
+    finally:
+        shutil.rmtree(outDir, ignore_errors=True)
+
+
+def runParseBenchmark(records=100000, processes=0, traceMemory=False):
+    if traceMemory:
+        tracemalloc.start()
+    try:
+        return runParseStages(records, processes)
+    finally:
+        if traceMemory:
+            tracemalloc.stop()
+
+
+def runParseStages(records, processes):
+    results = []
+    fileContent = timeStage(results, 'generate', records, generateMetelFile, records)
+    timeStage(results, 'parse', records, parseStage, fileContent)
+    if processes:
+        timeStage(results, 'preparse', records, preparseStage, fileContent, processes)
+    printResults(results)
+    return results
+
+
+def createKnownProducts(env, knownProducts):
+    """
+        Create the products matched by the first knownProducts records of the file
+    """
+    productObj = env['product.product']
+    for index in range(knownProducts):
+        productObj.create({'name': 'Benchmark product %d' % (index),
+                           'barcode': getBarcode(index)})
+
+
+def runBenchmark(env, records=100000, knownProducts=1000, traceMemory=False):
+    """
+        Time every stage of a Metel import of records lines, knownProducts of them
+        related to an existing product. Everything done is rolled back
+    """
+    results = []
+    if traceMemory:
+        tracemalloc.start()
+    try:
+        partner = env['res.partner'].create({'name': 'Metel benchmark vendor',
+                                             'vat': BENCHMARK_VAT,
+                                             'supplier': True})
+        createKnownProducts(env, knownProducts)
+        from odoo.addons.omnia_metel_import.models import supplier_info
+        fileContent = timeStage(results, 'generate', records, generateMetelFile, records)
+        timeStage(results, 'parse', records, parseStage, fileContent)
+        wizard = env['tmp.supplier_info_wizard'].create({})
+        timeStage(results, 'stage', records, wizard.runImport, fileContent)
+        stagedLines = wizard.getStagedLines()
+        toCreate, errors, _fingerprints, _matched = timeStage(results, 'match', len(stagedLines),
+                                                              wizard.matchStagedLines, partner, stagedLines)
+        timeStage(results, 'create', len(toCreate),
+                  supplier_info.bulkInsert, env['product.supplierinfo'], toCreate)
+        if errors:
+            print('%d match errors' % (len(errors)))
+    finally:
+        if traceMemory:
+            tracemalloc.stop()
+        env.cr.rollback()
+        env.invalidate_all()
+    printResults(results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Metel parse benchmark')
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--processes', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true', help='Report the peak traced memory of each stage')
+    arguments = parser.parse_args()
+    runParseBenchmark(arguments.records, arguments.processes, arguments.trace_memory)
@@ -1 +1,2 @@
 from . import supplier_info
+from . import metel_fingerprint
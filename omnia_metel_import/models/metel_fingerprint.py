@@ -0,0 +1,72 @@
+# -*- encoding: utf-8 -*-
+##############################################################################
+#
+#    OmniaSolutions, Your own solutions
+#    Copyright (C) 2010-2018 OmniaSolutions (<http://omniasolutions.eu>). All Rights Reserved
+#    $Id$
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from odoo import models
+from odoo import fields
+from odoo import api
+from odoo import _
+from psycopg2.extras import execute_values
+
+
+class MetelImportFingerprint(models.Model):
+    _name = 'metel.import.fingerprint'
+
+    partner_id = fields.Many2one('res.partner', string=_('Vendor'), required=True, ondelete='cascade')
+    codice_prodotto = fields.Char(_('Product Code'), required=True)
+    fingerprint = fields.Char(_('Fingerprint'))
+
+    _sql_constraints = [
+        ('partner_code_uniq', 'unique(partner_id, codice_prodotto)', 'Product code must be unique for each vendor'),
+    ]
+
+    @api.model
+    def getFingerprints(self, partnerId, codes):
+        """
+            Map each one of codes to its last imported fingerprint
+        """
+        if not codes:
+            return {}
+        self.env.cr.execute("""SELECT codice_prodotto, fingerprint
+                               FROM metel_import_fingerprint
+                               WHERE partner_id = %s AND codice_prodotto IN %s""", (partnerId, tuple(codes)))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def storeFingerprints(self, partnerId, fingerprints):
+        """
+            Insert or update the fingerprints dict (product code -> fingerprint) of the partner
+        """
+        if not fingerprints:
+            return
+        rows = [(partnerId, code, fingerprint, self.env.uid, self.env.uid) for code, fingerprint in fingerprints.items()]
+        execute_values(self.env.cr,
+                       """INSERT INTO metel_import_fingerprint
+                              (partner_id, codice_prodotto, fingerprint, create_uid, write_uid, create_date, write_date)
+                          VALUES %s
+                          ON CONFLICT (partner_id, codice_prodotto)
+                          DO UPDATE SET fingerprint = EXCLUDED.fingerprint,
+                                        write_uid = EXCLUDED.write_uid,
+                                        write_date = EXCLUDED.write_date""",
+                       rows,
+                       template="(%s, %s, %s, %s, %s, (now() at time zone 'UTC'), (now() at time zone 'UTC'))",
+                       page_size=len(rows))
+        self.invalidate_cache()
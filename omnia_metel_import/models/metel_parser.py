@@ -0,0 +1,311 @@
+# -*- encoding: utf-8 -*-
+##############################################################################
+#
+#    OmniaSolutions, Your own solutions
+#    Copyright (C) 2010-2018 OmniaSolutions (<http://omniasolutions.eu>). All Rights Reserved
+#    $Id$
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+'''
+Fixed width METEL record layouts.
+
+A mapping like metel_prodotto (field name -> (start, length)) is compiled
+once into a MetelRecordLayout: a struct unpacker plus one decoder per field,
+chosen from the field name at compile time. Decoding a record is then a single
+unpack_from on the uploaded bytes, with no per-field string sniffing.
+'''
+
+import struct
+import hashlib
+import logging
+import datetime
+
+
+metel_listino = dict(identificazione=(0, 20),
+                     azienda=(20, 3),
+                     partita_iva=(23, 11),
+                     listino=(34, 6),
+                     data_decorrenza_pubblico=(40, 8),
+                     data_variazione=(48, 8),
+                     descrizione=(56, 30),
+                     filler1=(86, 39),
+                     verifica=(125, 3),
+                     data_decorrenza_grossista=(128, 8),
+                     isopartita=(136, 16),
+                     filler2=(152, 25)
+)
+
+metel_prodotto = dict(marchio_produttore=(0, 3),  # (ad esempio VIW per VIMAR)
+                      codice_prodotto=(3, 16),
+                      ean13=(19, 13),
+                      descrizione=(32, 43),
+                      qta_in_cartone=(75, 5),
+                      qta_multipla_ordine=(80, 5),
+                      qta_minima_ordine=(85, 5),
+                      qta_massima_ordine=(90, 6),
+                      lead_time=(96, 1),  # quanto tempo passa dall'ordine alla consegna
+                      prezzo_al_grossista=(97, 11),
+                      prezzo_al_pubblico=(108, 11),
+                      moltiplicatore_prezzo=(119, 6),  # quantità di prodotto a cui si riferisce il prezzo
+                      codice_valuta=(125, 3),
+                      unita_misura=(128, 3),
+                      prodotto_composto=(131, 1),  # non rilevante
+                      stato_prodotto=(132, 1),  # 3=prodotto gestito, 9=annullato
+                      data_ultima_variazione_var=(133, 8),  # ultimo aggiornamento dei dati del prodotto
+                      famiglia_di_sconto=(141, 18),  # non rilevante
+                      famiglia_statistica=(159, 18),  # il codice della famiglia a cui si appartiene il prodotto
+)
+
+UOM_DESC = {'PCE': 'Pezzi',
+            'BRD': 'Cartoni',
+            'BLI': 'Blister',
+            'LM': 'Metri lineari',
+            'PL': 'Pallet',
+            'LE': 'Litri',
+            'KGM': 'Chilogrammi'
+}
+
+UOM = {'PCE': 'nr',
+       'BRD': '',  # 'Scatola',
+       'BLI': '',
+       'LM': '',  # 'mt',
+       'PL': '',
+       'LE': '',  # 'Litro/i',
+       'KGM': '',  # 'Kg'
+}
+
+
+class MetelCheckError(Exception):
+    pass
+
+
+def decodeChar(raw):
+    return raw.strip().decode('utf-8', errors='ignore')
+
+
+def decodePrice(raw):
+    # Last two digits are decimals
+    return int(raw) / 100.0
+
+
+def decodeInteger(raw):
+    return int(raw)
+
+
+def decodeDate(raw):
+    return datetime.date(int(raw[0:4]), int(raw[4:6]), int(raw[6:8]))
+
+
+def decodeLeadTime(raw):
+    if raw.isalpha():
+        return (ord(raw) - 63) * 5
+    return int(raw)
+
+
+def getFieldDecoder(fieldName):
+    if 'prezzo' in fieldName:
+        if 'moltiplicatore' not in fieldName:
+            return decodePrice
+        return decodeInteger
+    if 'data' in fieldName:
+        return decodeDate
+    if 'lead' in fieldName:
+        return decodeLeadTime
+    return decodeChar
+
+
+class MetelRecordLayout(object):
+
+    def __init__(self, mapping):
+        fieldsDef = sorted(mapping.items(), key=lambda item: item[1][0])
+        self.names = tuple(fieldName for fieldName, _charsRange in fieldsDef)
+        self.decoders = tuple(getFieldDecoder(fieldName) for fieldName in self.names)
+        self.slices = tuple((start, start + lenght) for _fieldName, (start, lenght) in fieldsDef)
+        self.fields = tuple(zip(self.names, self.decoders, self.slices))
+        fmt = []
+        offset = 0
+        for start, end in self.slices:
+            if start < offset:
+                # Overlapping fields cannot be unpacked by struct, slice them
+                fmt = None
+                break
+            if start > offset:
+                fmt.append('%dx' % (start - offset))
+            fmt.append('%ds' % (end - start))
+            offset = end
+        self.size = offset
+        self.unpacker = struct.Struct(''.join(fmt)) if fmt is not None else None
+
+    def decode(self, buffer, start=0, end=None):
+        """
+            Decode the record stored in buffer[start:end]
+        """
+        if end is None:
+            end = len(buffer)
+        if self.unpacker and end - start >= self.size:
+            try:
+                raws = self.unpacker.unpack_from(buffer, start)
+                return dict(zip(self.names, [decoder(raw) for decoder, raw in zip(self.decoders, raws)]))
+            except Exception:
+                pass  # Fall back on per field decoding to keep valid fields
+        return self.decodeFields(bytes(buffer[start:end]))
+
+    def decodeFields(self, line):
+        out = {}
+        for fieldName, decoder, (start, end) in self.fields:
+            try:
+                out[fieldName] = decoder(line[start:end])
+            except Exception as ex:
+                logging.error(ex)
+                out[fieldName] = ''
+        return out
+
+    def distinctValues(self, buffer, fieldName, start=0, end=None):
+        """
+            Set of the values of fieldName found in the lines of buffer[start:end]
+        """
+        index = self.names.index(fieldName)
+        decoder = self.decoders[index]
+        fieldStart, fieldEnd = self.slices[index]
+        raws = set(buffer[lineStart + fieldStart:min(lineStart + fieldEnd, lineEnd)]
+                   for lineStart, lineEnd in iterLines(buffer, start, end))
+        out = set()
+        for raw in raws:
+            try:
+                out.add(decoder(raw))
+            except Exception as ex:
+                logging.error(ex)
+        return out
+
+    def iterRecords(self, buffer, start=0, end=None):
+        """
+            Yield one decoded record for each line of buffer[start:end]
+        """
+        for lineStart, lineEnd in iterLines(buffer, start, end):
+            yield self.decode(buffer, lineStart, lineEnd)
+
+
+def iterLines(buffer, start=0, end=None):
+    """
+        Yield (start, end) offsets of every not empty line, without line terminators
+    """
+    if end is None:
+        end = len(buffer)
+    while start < end:
+        newLine = buffer.find(b'\n', start, end)
+        nextStart = end if newLine < 0 else newLine + 1
+        lineEnd = nextStart
+        while lineEnd > start and buffer[lineEnd - 1:lineEnd] in (b'\n', b'\r'):
+            lineEnd -= 1
+        if lineEnd - start > 1 or (lineEnd > start and buffer[start:lineEnd] != b'\x1a'):
+            yield start, lineEnd
+        start = nextStart
+
+
+def getLineLength(buffer, start=0):
+    """
+        Length of the line starting at start, line terminators included
+    """
+    newLine = buffer.find(b'\n', start)
+    if newLine < 0:
+        return len(buffer) - start
+    return newLine + 1 - start
+
+
+def getChunkEnd(buffer, start, size):
+    """
+        Offset of the first line starting at least size bytes after start
+    """
+    end = start + size
+    if end >= len(buffer):
+        return len(buffer)
+    newLine = buffer.find(b'\n', end)
+    if newLine < 0:
+        return len(buffer)
+    return newLine + 1
+
+
+_layouts = {}
+
+
+def getLayout(mapping):
+    key = tuple(sorted(mapping.items()))
+    layout = _layouts.get(key)
+    if layout is None:
+        layout = _layouts[key] = MetelRecordLayout(mapping)
+    return layout
+
+
+def checkProdotto(prodotto_metel):
+    """
+        Raise MetelCheckError if the decoded product record cannot be imported
+    """
+    if prodotto_metel['codice_valuta'] != 'EUR':
+        raise MetelCheckError('il campo VALUTA è diverso da EUR e lo script non ne prevede la gestione,')
+    if prodotto_metel['stato_prodotto'] in [8, 1]:
+        raise MetelCheckError('il campo stato é {0} e '
+                              'lo script non ne prevede la gestione,'.format(prodotto_metel['stato_prodotto']))
+    if prodotto_metel['unita_misura'] not in UOM_DESC.keys():
+        raise MetelCheckError('il campo UNITA DI MISURA non è tra quelli METEL,')
+    if UOM[prodotto_metel['unita_misura']] == '':
+        raise MetelCheckError('il campo UNITA DI MISURA è {0} '
+                              'e lo script non ne prevede la gestione'.format(prodotto_metel['unita_misura']))
+
+
+def getStagingValues(line, currencyId, uomId):
+    """
+        tmp.supplier_info values of the decoded product record line
+    """
+    return {
+        # Float
+        'prezzo_al_grossista': float(line.get('prezzo_al_grossista', False)),
+        'prezzo_al_pubblico': float(line.get('prezzo_al_pubblico', False)),
+        'qta_multipla_ordine': float(line.get('qta_multipla_ordine', False)),
+        'moltiplicatore_prezzo': float(line.get('moltiplicatore_prezzo', False)),
+        'qta_massima_ordine': float(line.get('qta_massima_ordine', False)),
+        'qta_minima_ordine': float(line.get('qta_minima_ordine', False)),
+        'qta_in_cartone': float(line.get('qta_in_cartone', False)),
+        'lead_time': float(line.get('lead_time', False)),
+        # Date
+        'data_ultima_variazione_var': line.get('data_ultima_variazione_var', False),
+        # Char
+        'ean13': line.get('ean13', False),
+        'famiglia_statistica': line.get('famiglia_statistica', False),
+        'stato_prodotto': line.get('stato_prodotto', False),
+        'codice_prodotto': line.get('codice_prodotto', False),
+        'marchio_produttore': line.get('marchio_produttore', False),
+        'famiglia_di_sconto': line.get('famiglia_di_sconto', False),
+        'prodotto_composto': line.get('prodotto_composto', False),
+        'descrizione': line.get('descrizione', False),
+        # many2one
+        'unita_misura': uomId,
+        'codice_valuta': currencyId,
+        }
+
+
+def computeFingerprint(vals, validityDate):
+    """
+        Hash of the values that change a supplier info, used to skip unchanged records in delta imports
+        vals are the tmp.supplier_info staging values, validityDate the header data_decorrenza_pubblico
+        that becomes the supplier info end date
+    """
+    key = '%r|%r|%r|%s|%s' % (vals['prezzo_al_pubblico'],
+                              vals['qta_minima_ordine'],
+                              vals['lead_time'],
+                              vals['data_ultima_variazione_var'],
+                              validityDate)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
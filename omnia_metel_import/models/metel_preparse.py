@@ -0,0 +1,177 @@
+# -*- encoding: utf-8 -*-
+##############################################################################
+#
+#    OmniaSolutions, Your own solutions
+#    Copyright (C) 2010-2018 OmniaSolutions (<http://omniasolutions.eu>). All Rights Reserved
+#    $Id$
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+'''
+Parallel pre-parse of big METEL files, outside the Odoo worker.
+
+runPreparse starts this file in a new interpreter, which inherits no database
+connection, lock or thread of the Odoo worker. From there a process pool
+checks and converts pieces of the file, split on line boundaries, and writes
+the staging rows of each piece in a CSV file for PostgreSQL COPY.
+The Odoo worker then copies the pieces into tmp_supplier_info in file order.
+
+The job is read as JSON from stdin and the result is written as JSON to stdout:
+the piece files in file order and the number of parsed records, or the first
+check error of the file.
+'''
+
+import os
+import csv
+import sys
+import json
+import mmap
+import resource
+import subprocess
+import multiprocessing
+
+try:
+    from . import metel_parser
+except ImportError:
+    import metel_parser
+
+
+STAGING_COLUMNS = ('prezzo_al_grossista',
+                   'prezzo_al_pubblico',
+                   'qta_multipla_ordine',
+                   'moltiplicatore_prezzo',
+                   'qta_massima_ordine',
+                   'qta_minima_ordine',
+                   'qta_in_cartone',
+                   'lead_time',
+                   'data_ultima_variazione_var',
+                   'ean13',
+                   'famiglia_statistica',
+                   'stato_prodotto',
+                   'codice_prodotto',
+                   'marchio_produttore',
+                   'famiglia_di_sconto',
+                   'prodotto_composto',
+                   'descrizione',
+                   'unita_misura',
+                   'codice_valuta',
+                   'fingerprint',
+                   'wizard_id',
+                   'create_uid',
+                   'write_uid',
+                   'create_date',
+                   'write_date')
+# Pieces for each process, so that a slow piece does not leave the others idle
+PIECES_PER_PROCESS = 4
+
+
+class MetelPreparseError(Exception):
+    pass
+
+
+def limitMemory(limit):
+    if limit:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def parsePiece(args):
+    """
+        Check and convert the records of buffer[start:end] writing them in outPath,
+        return the number of parsed records and the first check error
+    """
+    job, start, end, outPath = args
+    layout = metel_parser.getLayout(metel_parser.metel_prodotto)
+    currencies = job['currencies']
+    uoms = job['uoms']
+    fixedValues = {'wizard_id': job['wizardId'],
+                   'create_uid': job['uid'],
+                   'write_uid': job['uid'],
+                   'create_date': job['now'],
+                   'write_date': job['now']}
+    counter = 0
+    with open(job['filePath'], 'rb') as fileObj, open(outPath, 'w', encoding='utf-8', newline='') as outFile:
+        # Unquoted empty values, as None and empty strings are written, are copied as NULL
+        writer = csv.writer(outFile, lineterminator='\n')
+        with mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for line in layout.iterRecords(buffer, start, end):
+                counter += 1
+                try:
+                    metel_parser.checkProdotto(line)
+                except metel_parser.MetelCheckError as ex:
+                    return counter, ex.args[0]
+                vals = metel_parser.getStagingValues(line,
+                                                     currencies.get(line['codice_valuta']) or None,
+                                                     uoms.get(line['unita_misura']) or None)
+                vals['fingerprint'] = metel_parser.computeFingerprint(vals, job['validityDate'])
+                vals.update(fixedValues)
+                writer.writerow([vals[column] for column in STAGING_COLUMNS])
+    return counter, None
+
+
+def splitPieces(job):
+    """
+        Split the job range on line boundaries, one piece file each
+    """
+    start, end = job['start'], job['end']
+    pieceCount = max(job['processes'] * PIECES_PER_PROCESS, 1)
+    pieceSize = max((end - start) // pieceCount, 1)
+    pieces = []
+    with open(job['filePath'], 'rb') as fileObj:
+        with mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            while start < end:
+                pieceEnd = min(metel_parser.getChunkEnd(buffer, start, pieceSize), end)
+                outPath = os.path.join(job['outDir'], 'piece-%05d.tsv' % (len(pieces)))
+                pieces.append((job, start, pieceEnd, outPath))
+                start = pieceEnd
+    return pieces
+
+
+def preparse(job):
+    pieces = splitPieces(job)
+    # The memory limit of this process is inherited by the forked ones
+    pool = multiprocessing.Pool(job['processes'])
+    try:
+        results = pool.map(parsePiece, pieces, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+    counter = 0
+    for (_job, _start, _end, _outPath), (pieceCounter, error) in zip(pieces, results):
+        counter += pieceCounter
+        if error:
+            return {'records': counter, 'error': error}
+    return {'records': counter, 'pieces': [outPath for _job, _start, _end, outPath in pieces]}
+
+
+def runPreparse(job):
+    """
+        Pre-parse job in a new interpreter, return its result dict
+    """
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               close_fds=True)
+    out, err = process.communicate(json.dumps(job).encode('utf-8'))
+    if process.returncode:
+        raise MetelPreparseError('METEL pre-parse failed: %s' % (err.decode('utf-8', errors='ignore')[-2000:]))
+    return json.loads(out.decode('utf-8'))
+
+
+if __name__ == '__main__':
+    preparseJob = json.load(sys.stdin)
+    limitMemory(preparseJob.get('memoryLimit'))
+    json.dump(preparse(preparseJob), sys.stdout)
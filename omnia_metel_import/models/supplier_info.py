@@ -27,6 +27,7 @@ Created on Jul 30, 2018
 '''
 
 from odoo.exceptions import UserError
+import os
 import logging
 import datetime
 from odoo import models
@@ -34,9 +35,29 @@ from odoo import fields
 from odoo import api
 from odoo import _
 from odoo.addons import decimal_precision as dp
-import os
-import tempfile
+from odoo.tools import float_compare
+from odoo.tools import split_every
+from odoo.osv import expression
+from odoo.tools import config
 import base64
+import mmap
+import shutil
+import tempfile
+from contextlib import contextmanager
+from psycopg2.extras import execute_values
+from .metel_parser import metel_listino
+from .metel_parser import metel_prodotto
+from .metel_parser import getLayout
+from .metel_parser import getLineLength
+from .metel_parser import getChunkEnd
+from .metel_parser import checkProdotto
+from .metel_parser import getStagingValues
+from .metel_parser import computeFingerprint
+from .metel_parser import MetelCheckError
+from .metel_parser import UOM
+from .metel_preparse import runPreparse
+from .metel_preparse import MetelPreparseError
+from .metel_preparse import STAGING_COLUMNS
 
 # TODO: mettere tutte queste variabili nelle variabili di sistema in modo che il cliente possa sistemarsele da solo
 LEAD_TIME = 5
@@ -45,59 +66,16 @@ STATO_PRODOTTO = 0
 LEAD_TIME = 7
 MOLTIPLICATORE_PREZZO = 1
 EAN13 = '0000000000000'
-
-UOM_DESC = {'PCE': 'Pezzi',
-            'BRD': 'Cartoni',
-            'BLI': 'Blister',
-            'LM': 'Metri lineari',
-            'PL': 'Pallet',
-            'LE': 'Litri',
-            'KGM': 'Chilogrammi'
-}
-
-UOM = {'PCE': 'nr',
-       'BRD': '',  # 'Scatola',
-       'BLI': '',
-       'LM': '',  # 'mt',
-       'PL': '',
-       'LE': '',  # 'Litro/i',
-       'KGM': '',  # 'Kg'
-}
-
-metel_listino = dict(identificazione=(0, 20),
-                     azienda=(20, 3),
-                     partita_iva=(23, 11),
-                     listino=(34, 6),
-                     data_decorrenza_pubblico=(40, 8),
-                     data_variazione=(48, 8),
-                     descrizione=(56, 30),
-                     filler1=(86, 39),
-                     verifica=(125, 3),
-                     data_decorrenza_grossista=(128, 8),
-                     isopartita=(136, 16),
-                     filler2=(152, 25)
-)
-
-metel_prodotto = dict(marchio_produttore=(0, 3),  # (ad esempio VIW per VIMAR)
-                      codice_prodotto=(3, 16),
-                      ean13=(19, 13),
-                      descrizione=(32, 43),
-                      qta_in_cartone=(75, 5),
-                      qta_multipla_ordine=(80, 5),
-                      qta_minima_ordine=(85, 5),
-                      qta_massima_ordine=(90, 6),
-                      lead_time=(96, 1),  # quanto tempo passa dall'ordine alla consegna
-                      prezzo_al_grossista=(97, 11),
-                      prezzo_al_pubblico=(108, 11),
-                      moltiplicatore_prezzo=(119, 6),  # quantità di prodotto a cui si riferisce il prezzo
-                      codice_valuta=(125, 3),
-                      unita_misura=(128, 3),
-                      prodotto_composto=(131, 1),  # non rilevante
-                      stato_prodotto=(132, 1),  # 3=prodotto gestito, 9=annullato
-                      data_ultima_variazione_var=(133, 8),  # ultimo aggiornamento dei dati del prodotto
-                      famiglia_di_sconto=(141, 18),  # non rilevante
-                      famiglia_statistica=(159, 18),  # il codice della famiglia a cui si appartiene il prodotto
-)
+STAGING_CHUNK_SIZE = 5000
+SEARCH_CHUNK_SIZE = 10000
+IMPORT_CHUNK_SIZE = 20000
+IMPORT_CHUNK_BYTES = IMPORT_CHUNK_SIZE * 179
+# Days finished or failed imports are kept, with their staged lines
+IMPORT_RETENTION_DAYS = 7
+# Parallel parse processes, 0 or 1 to parse in the Odoo worker
+PARSE_PROCESSES_PARAM = 'omnia_metel_import.parse_processes'
+# Smaller ranges are parsed in the Odoo worker, as starting the pre-parse costs more than it saves
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
 
 standard_0 = {'codice_prodotto': 'CODICE',
               'descrizione': 'DESCRIZIONE',
@@ -123,11 +101,45 @@ standard_1 = {'ref': 'ref',
               'ean13': 'ean13'
 }
 
+LISTINO_LAYOUT = getLayout(metel_listino)
+PRODOTTO_LAYOUT = getLayout(metel_prodotto)
+
 
-class ProductSupplierinfoWizard(models.TransientModel):
+def bulkInsert(modelObj, valsList):
+    """
+        Insert valsList in the modelObj table with one query, skipping the ORM create.
+        Only stored columns are written and the missing ones get the model defaults
+    """
+    if not valsList:
+        return
+    modelObj.check_access_rights('create')
+    storedFields = dict((fieldName, field) for fieldName, field in modelObj._fields.items()
+                        if field.store and field.column_type and fieldName not in models.MAGIC_COLUMNS)
+    givenNames = set(fieldName for vals in valsList for fieldName in vals)
+    defaults = modelObj.default_get([fieldName for fieldName in storedFields if fieldName not in givenNames])
+    columns = [fieldName for fieldName in storedFields if fieldName in givenNames or fieldName in defaults]
+    rows = []
+    for vals in valsList:
+        row = []
+        for column in columns:
+            value = vals.get(column, defaults.get(column))
+            if (value is False and storedFields[column].type != 'boolean') or value == '':
+                value = None
+            row.append(value)
+        row.extend([modelObj.env.uid, modelObj.env.uid])
+        rows.append(row)
+    query = 'INSERT INTO "%s" (%s, create_uid, write_uid, create_date, write_date) VALUES %%s' % (
+        modelObj._table,
+        ', '.join('"%s"' % column for column in columns))
+    template = '(%s, (now() at time zone \'UTC\'), (now() at time zone \'UTC\'))' % ', '.join(['%s'] * (len(columns) + 2))
+    execute_values(modelObj.env.cr, query, rows, template=template, page_size=len(rows))
+    modelObj.invalidate_cache()
+
+
+class ProductSupplierinfoWizard(models.Model):
     _name = 'tmp.supplier_info_wizard'
 
-    fileData = fields.Binary(string='Metel file')
+    fileData = fields.Binary(string='Metel file', attachment=True)
     supplier_infos = fields.One2many('tmp.supplier_info', inverse_name='wizard_id', string='Supplier Infos')
     error_message = fields.Char(string='Error')
 
@@ -143,27 +155,70 @@ class ProductSupplierinfoWizard(models.TransientModel):
     isopartita = fields.Char(_('ISO VAT'))
     filler1 = fields.Char(_('Filler 1'))
     filler2 = fields.Char(_('Filler 2'))
-    
+    delta_import = fields.Boolean(_('Only Changed Products'),
+                                  help=_('Skip the products whose price, minimum quantity, lead time and variation date did not change since the last import of this vendor'))
+
+    import_state = fields.Selection([('draft', 'Draft'),
+                                     ('queued', 'Queued'),
+                                     ('parsing', 'Parsing'),
+                                     ('matching', 'Matching'),
+                                     ('done', 'Done'),
+                                     ('failed', 'Failed')],
+                                    string=_('Background Import'),
+                                    default='draft')
+    import_offset = fields.Integer(_('Next Record Offset'))
+    match_last_id = fields.Integer(_('Last Matched Line'))
+    lines_parsed = fields.Integer(_('Lines Parsed'))
+    lines_unchanged = fields.Integer(_('Lines Unchanged'))
+    lines_matched = fields.Integer(_('Lines Matched'))
+    lines_error = fields.Integer(_('Lines In Error'))
+    import_log = fields.Text(_('Import Errors'))
 
     @api.model
     def checkImportMetel(self):
-        self.supplier_infos = []
+        self.deleteStagedLines()
         self.error_message = ''
-        tempDir = tempfile.gettempdir()
-        tmpFile = os.path.join(tempDir, 'metel.txt')
-        if os.path.exists(tmpFile):
-            os.unlink(tmpFile)
-        with open(tmpFile, 'wb') as fileObj:
-            fileObj.write(base64.b64decode(self.fileData))
-        tmpFileReader = open(tmpFile, 'rb')
         if not self.fileData:
             self.error_message = 'Cannot compute empty file'
             return self.returnWizard()
-        if not self.checkIntegrity(tmpFileReader):
-            return self.returnWizard()
-        self.runImport(tmpFile)
+        try:
+            with self.env.cr.savepoint(), self.openMetelFile() as fileContent:
+                self.runImport(fileContent)
+        except MetelCheckError as ex:
+            # Staged lines and header values have been rolled back
+            self.invalidate_cache()
+            self.error_message = ex.args[0]
         return self.returnWizard()
         
+    @contextmanager
+    def openMetelFile(self):
+        """
+            Yield the uploaded file content, memory mapped when it is stored in the filestore
+        """
+        filePath = self.getMetelFilePath()
+        if filePath:
+            with open(filePath, 'rb') as fileObj:
+                with mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ) as fileContent:
+                    yield fileContent
+        else:
+            yield base64.b64decode(self.fileData)
+
+    @api.multi
+    def getMetelFilePath(self):
+        """
+            Filestore path of the uploaded file, False when stored in the database
+        """
+        attachment = self.env['ir.attachment'].sudo().search([('res_model', '=', self._name),
+                                                              ('res_field', '=', 'fileData'),
+                                                              ('res_id', '=', self.id)], limit=1)
+        if attachment.store_fname:
+            return attachment._full_path(attachment.store_fname)
+        return False
+
+    @api.model
+    def getParseProcesses(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(PARSE_PROCESSES_PARAM, 0))
+
     @api.multi
     def returnWizard(self):
         return {'name': _('Import Metel'),
@@ -184,156 +239,213 @@ class ProductSupplierinfoWizard(models.TransientModel):
             return ''
         
     @api.model
-    def checkIntegrity(self, tmpFileReader):
-        header = tmpFileReader.readline()
-        if len(header) != 179:
-            self.error_message = 'La lunghezza dei records è di {0} non 179+cr+lf caratteri come previsto da METEL'.format(len(header))
-            return False
-        listino_metel = self.getLineData(header, metel_listino)
+    def checkHeader(self, fileContent, headerLength):
+        if headerLength != 179:
+            raise MetelCheckError('La lunghezza dei records è di {0} non 179+cr+lf caratteri come previsto da METEL'.format(headerLength))
+        listino_metel = LISTINO_LAYOUT.decode(fileContent, 0, headerLength)
         if 'LISTINO METEL' != listino_metel.get('identificazione', ''):
-            self.error_message = 'Il file {0} non contiene un listino METEL'.format('METEL.TXT')
-            return False
+            raise MetelCheckError('Il file {0} non contiene un listino METEL'.format('METEL.TXT'))
         if listino_metel.get('verifica', '') != '020':
-            self.error_message = 'Il listino non è nel formato 020'
-            return False
+            raise MetelCheckError('Il listino non è nel formato 020')
         if listino_metel.get('isopartita', '') != '':
-            self.error_message = 'Il campo ISOPARTITA è compilato e lo script non ne prevede la gestione'
-            return False
-    
-        for prodotto in tmpFileReader.readlines():
-            prodotto_metel = self.getLineData(prodotto, metel_prodotto)
-            if prodotto_metel['codice_valuta'] != 'EUR':
-                self.error_message = 'il campo VALUTA è diverso da EUR e lo script non ne prevede la gestione,'
-                return False
-            if prodotto_metel['stato_prodotto'] in [8, 1]:
-                self.error_message = 'il campo stato é {0} e ' \
-                      'lo script non ne prevede la gestione,'.format(prodotto_metel['stato_prodotto'])
-                return False
-            if prodotto_metel['unita_misura'] not in UOM_DESC.keys():
-                self.error_message = 'il campo UNITA DI MISURA non è tra quelli METEL,'
-                return False
-            else:
-                if UOM[prodotto_metel['unita_misura']] == '':
-                    self.error_message = 'il campo UNITA DI MISURA è {0} ' \
-                          'e lo script non ne prevede la gestione'.format(prodotto_metel['unita_misura'])
-                    return False
-        return True
+            raise MetelCheckError('Il campo ISOPARTITA è compilato e lo script non ne prevede la gestione')
+        return listino_metel
+
+    @api.model
+    def checkRecord(self, prodotto_metel):
+        checkProdotto(prodotto_metel)
         
     def getLineData(self, lineToCompute, mapping):
-        fields = {}
-        for fieldName, charsRange in mapping.items():
-            try:
-                start, lenght = charsRange
-                end = start + lenght
-        
-                if 'prezzo' in fieldName:
-                    if 'moltiplicatore' not in fieldName:
-                        integer = self.decodeBytes(lineToCompute[start:end - 2])
-                        decimals = self.decodeBytes(lineToCompute[end - 2:end])
-                        fields[fieldName] = float('{0}.{1}'.format(integer, decimals))
-                    else:
-                        fields[fieldName] = int(lineToCompute[start:end])
-                else:
-                    if 'data' in fieldName:
-                        year = int(self.decodeBytes(lineToCompute[start:end - 4]))
-                        month = int(self.decodeBytes(lineToCompute[start + 4:end - 2]))
-                        day = int(self.decodeBytes(lineToCompute[start + 6:end]))
-                        fields[fieldName] = datetime.date(year, month, day)
-                    else:
-                        if 'lead' in fieldName:
-                            lead = self.decodeBytes(lineToCompute[start:end])
-                            if lead.isalpha():
-                                fields[fieldName] = (ord(lead) - 63) * 5
-                            else:
-                                fields[fieldName] = int(lead)
-                        else:
-                            fields[fieldName] = self.decodeBytes(lineToCompute[start:end].strip())
-            except Exception as ex:
-                logging.error(ex)
-                fields[fieldName] = ''
-    
-        return fields
+        return getLayout(mapping).decode(lineToCompute)
 
     @api.multi
     def commonSearchObj(self, refObj, relFilter):
         obj = self.env[refObj]
-        res = obj.search(relFilter)
+        res = obj.search(relFilter, limit=1)
         for elem in res:
             return elem.id
         return False
+
+    @api.model
+    def resolveCached(self, resolutionCache, refObj, name):
+        """
+            Search refObj by name only the first time name is found in the import
+        """
+        resolved = resolutionCache.setdefault(refObj, {})
+        if name not in resolved:
+            resolved[name] = self.commonSearchObj(refObj, [('name', 'ilike', name)])
+        return resolved[name]
+
+    @api.model
+    def prefillResolutionCache(self, resolutionCache, refObj, names):
+        """
+            Resolve all names of refObj with a single search_read, each name gets the first
+            record containing it as resolveCached would do. Names not found are left to resolveCached
+        """
+        resolved = resolutionCache.setdefault(refObj, {})
+        names = [name for name in names if name and name not in resolved]
+        if not names:
+            return
+        domain = expression.OR([[('name', 'ilike', name)] for name in names])
+        records = self.env[refObj].search_read(domain, ['name'])
+        for name in names:
+            for record in records:
+                if name.lower() in (record['name'] or '').lower():
+                    resolved[name] = record['id']
+                    break
         
     @api.model
-    def runImport(self, tmpFile):
-        tmpFileReader = open(tmpFile, 'rb')
+    def runImport(self, fileContent):
+        """
+            Check and stage the METEL file in a single pass, raise MetelCheckError on the first wrong record
+        """
+        headerLength = self.importHeader(fileContent)
+        counter, unchanged = self.stageRecords(fileContent, headerLength)
+        self.write({'lines_parsed': counter,
+                    'lines_unchanged': unchanged})
+
+    @api.model
+    def importHeader(self, fileContent):
+        """
+            Check the header and store its values on the wizard, return the header length
+        """
+        headerLength = getLineLength(fileContent)
+        line = self.checkHeader(fileContent, headerLength)
+        self.write({'filler1': line.get('filler1', ''),
+                    'data_decorrenza_pubblico': line.get('data_decorrenza_pubblico', False),
+                    'verifica': line.get('verifica', ''),
+                    'filler2': line.get('filler2', ''),
+                    'partita_iva': line.get('partita_iva', ''),
+                    'listino': line.get('listino', ''),
+                    'data_decorrenza_grossista': line.get('data_decorrenza_grossista', False),
+                    'identificazione': line.get('identificazione', ''),
+                    'azienda': line.get('azienda', ''),
+                    'data_variazione': line.get('data_variazione', False),
+                    'descrizione': line.get('descrizione', ''),
+                    'isopartita': line.get('isopartita', '')})
+        return headerLength
+
+    @api.model
+    def stageRecords(self, fileContent, start, end=None):
+        """
+            Check and stage the records found between byte offsets start and end.
+            Return the number of parsed records and the number of records skipped
+            because unchanged since the last delta import
+        """
+        if end is None:
+            end = len(fileContent)
+        resolutionCache = {'res.currency': {}, 'product.uom': {}}
+        self.prefillResolutionCache(resolutionCache, 'res.currency',
+                                    PRODOTTO_LAYOUT.distinctValues(fileContent, 'codice_valuta', start, end))
+        self.prefillResolutionCache(resolutionCache, 'product.uom',
+                                    [UOM.get(code) for code in PRODOTTO_LAYOUT.distinctValues(fileContent, 'unita_misura', start, end)])
+        deltaPartner = self.delta_import and self.getPartner(self.partita_iva)
+        validityDate = self.data_decorrenza_pubblico
+        processes = min(self.getParseProcesses(), os.cpu_count() or 1)
+        if processes > 1 and end - start >= PARALLEL_MIN_BYTES:
+            filePath = self.getMetelFilePath()
+            if filePath:
+                return self.stageRecordsParallel(fileContent, filePath, start, end, processes,
+                                                 resolutionCache, deltaPartner)
+        toStage = []
         counter = 0
-        for lineReader in tmpFileReader.readlines():
-            if counter == 0:
-                line = self.getLineData(lineReader, metel_listino)
-                self.filler1 = line.get('filler1', '')
-                self.data_decorrenza_pubblico = line.get('data_decorrenza_pubblico', False)
-                self.verifica = line.get('verifica', '')
-                self.filler2 = line.get('filler2', '')
-                self.partita_iva = line.get('partita_iva', '')
-                self.listino = line.get('listino', '')
-                self.data_decorrenza_grossista = line.get('data_decorrenza_grossista', False)
-                self.identificazione = line.get('identificazione', '')
-                self.azienda = line.get('azienda', '')
-                self.data_variazione = line.get('data_variazione', False)
-                self.descrizione = line.get('descrizione', '')
-                self.isopartita = line.get('isopartita', '')
-                counter = 1
-                continue
-            line = self.getLineData(lineReader, metel_prodotto)
-            
-            prezzo_al_grossista = line.get('prezzo_al_grossista', False)
-            ean13 = line.get('ean13', False)
-            famiglia_statistica = line.get('famiglia_statistica', False)
-            stato_prodotto = line.get('stato_prodotto', False)
-            codice_prodotto = line.get('codice_prodotto', False)
-            lead_time = line.get('lead_time', False)
-            prezzo_al_pubblico = line.get('prezzo_al_pubblico', False)
-            marchio_produttore = line.get('marchio_produttore', False)
-            data_ultima_variazione_var = line.get('data_ultima_variazione_var', False)
-            qta_multipla_ordine = line.get('qta_multipla_ordine', False)
-            famiglia_di_sconto = line.get('famiglia_di_sconto', False)
-            qta_minima_ordine = line.get('qta_minima_ordine', False)
-            prodotto_composto = line.get('prodotto_composto', False)
-            moltiplicatore_prezzo = line.get('moltiplicatore_prezzo', False)
-            qta_massima_ordine = line.get('qta_massima_ordine', False)
-            descrizione = line.get('descrizione', False)
-            qta_in_cartone = line.get('qta_in_cartone', False)
-            
-            codice_valuta = self.commonSearchObj('res.currency', [('name', 'ilike', line.get('codice_valuta', ''))])
-            unita_misura = self.commonSearchObj('product.uom', [('name', 'ilike', UOM.get(line.get('unita_misura', '')))])
-            
-            vals = {
-                # Float
-                'prezzo_al_grossista': float(prezzo_al_grossista),
-                'prezzo_al_pubblico': float(prezzo_al_pubblico),
-                'qta_multipla_ordine': float(qta_multipla_ordine),
-                'moltiplicatore_prezzo': float(moltiplicatore_prezzo),
-                'qta_massima_ordine': float(qta_massima_ordine),
-                'qta_minima_ordine': float(qta_minima_ordine),
-                'qta_in_cartone': float(qta_in_cartone),
-                'lead_time': float(lead_time),
-                # Date
-                'data_ultima_variazione_var': data_ultima_variazione_var,
-                # Char
-                'ean13': ean13,
-                'famiglia_statistica': famiglia_statistica,
-                'stato_prodotto': stato_prodotto,
-                'codice_prodotto': codice_prodotto,
-                'marchio_produttore': marchio_produttore,
-                'famiglia_di_sconto': famiglia_di_sconto,
-                'prodotto_composto': prodotto_composto,
-                'descrizione': descrizione,
-                # many2one
-                'unita_misura': unita_misura,
-                'codice_valuta': codice_valuta,
-                
-                'wizard_id': self.ids[0],
-                }
-            self.env['tmp.supplier_info'].create(vals)
+        unchanged = 0
+        for line in PRODOTTO_LAYOUT.iterRecords(fileContent, start, end):
+            counter += 1
+            self.checkRecord(line)
+            codice_valuta = self.resolveCached(resolutionCache, 'res.currency', line.get('codice_valuta', ''))
+            unita_misura = self.resolveCached(resolutionCache, 'product.uom', UOM.get(line.get('unita_misura', '')))
+            vals = getStagingValues(line, codice_valuta, unita_misura)
+            vals['wizard_id'] = self.ids[0]
+            # Always stored, so that the next delta import compares with this one
+            vals['fingerprint'] = computeFingerprint(vals, validityDate)
+            toStage.append(vals)
+            if len(toStage) >= STAGING_CHUNK_SIZE:
+                unchanged += self.stageChanged(toStage, deltaPartner)
+                toStage = []
+        if toStage:
+            unchanged += self.stageChanged(toStage, deltaPartner)
+        self.invalidate_cache(['supplier_infos'], self.ids)
+        return counter, unchanged
+
+    @api.multi
+    def stageRecordsParallel(self, fileContent, filePath, start, end, processes, resolutionCache, deltaPartner=False):
+        """
+            Same as stageRecords, with check and conversion of the records done by the
+            metel_preparse processes and their rows copied in the staging table
+        """
+        currencies = {}
+        for code in PRODOTTO_LAYOUT.distinctValues(fileContent, 'codice_valuta', start, end):
+            currencies[code] = self.resolveCached(resolutionCache, 'res.currency', code)
+        uoms = {}
+        for code in PRODOTTO_LAYOUT.distinctValues(fileContent, 'unita_misura', start, end):
+            if UOM.get(code):
+                uoms[code] = self.resolveCached(resolutionCache, 'product.uom', UOM[code])
+        outDir = tempfile.mkdtemp(prefix='metel_preparse_')
+        try:
+            job = {'filePath': filePath,
+                   'start': start,
+                   'end': end,
+                   'processes': processes,
+                   'memoryLimit': config.get('limit_memory_hard') or 0,
+                   'outDir': outDir,
+                   'currencies': currencies,
+                   'uoms': uoms,
+                   'validityDate': self.data_decorrenza_pubblico,
+                   'wizardId': self.id,
+                   'uid': self.env.uid,
+                   'now': fields.Datetime.now()}
+            try:
+                result = runPreparse(job)
+            except MetelPreparseError as ex:
+                raise UserError(ex.args[0])
+            if result.get('error'):
+                raise MetelCheckError(result['error'])
+            self.env.cr.execute("SELECT COALESCE(MAX(id), 0) FROM tmp_supplier_info WHERE wizard_id = %s", (self.id,))
+            lastId = self.env.cr.fetchone()[0]
+            query = 'COPY tmp_supplier_info (%s) FROM STDIN WITH CSV' % ', '.join('"%s"' % column for column in STAGING_COLUMNS)
+            for piecePath in result['pieces']:
+                with open(piecePath, 'rb') as pieceFile:
+                    self.env.cr.copy_expert(query, pieceFile)
+        finally:
+            shutil.rmtree(outDir, ignore_errors=True)
+        unchanged = 0
+        if deltaPartner:
+            unchanged = self.deleteUnchangedLines(deltaPartner, lastId)
+        self.invalidate_cache(['supplier_infos'], self.ids)
+        return result['records'], unchanged
+
+    @api.multi
+    def deleteUnchangedLines(self, partner, afterId=0):
+        """
+            Delete the staged lines after afterId with the same fingerprint of the last
+            delta import of partner, return the number of deleted lines
+        """
+        self.env.cr.execute("""DELETE FROM tmp_supplier_info staged
+                               USING metel_import_fingerprint stored
+                               WHERE staged.wizard_id = %s
+                                 AND staged.id > %s
+                                 AND stored.partner_id = %s
+                                 AND stored.codice_prodotto = staged.codice_prodotto
+                                 AND stored.fingerprint = staged.fingerprint""", (self.id, afterId, partner.id))
+        return self.env.cr.rowcount
+
+    @api.model
+    def stageChanged(self, toStage, deltaPartner=False):
+        """
+            Stage toStage values, leaving out the ones with the same fingerprint of the last
+            delta import of deltaPartner. Return the number of values left out
+        """
+        if deltaPartner:
+            fingerprints = self.env['metel.import.fingerprint'].getFingerprints(
+                deltaPartner.id,
+                set(vals['codice_prodotto'] for vals in toStage if vals['codice_prodotto']))
+            changed = [vals for vals in toStage
+                       if not vals['codice_prodotto'] or fingerprints.get(vals['codice_prodotto']) != vals['fingerprint']]
+        else:
+            changed = toStage
+        self.env['tmp.supplier_info'].bulkCreate(changed)
+        return len(toStage) - len(changed)
 
     @api.multi
     def action_test_import(self):
@@ -372,47 +484,286 @@ class ProductSupplierinfoWizard(models.TransientModel):
             ])
         
     @api.multi
-    def action_import(self):
-        partner = self.getPartner(self.partita_iva)
-        if not partner:
-            raise UserError(_('Unable to find related partner using VAT %r' % (self.partita_iva)))
-        
+    def getStagedLines(self, afterId=0, limit=None):
+        self.env.cr.execute("""SELECT id, ean13, codice_prodotto, descrizione, lead_time, qta_minima_ordine,
+                                      prezzo_al_pubblico, data_ultima_variazione_var, codice_valuta, fingerprint
+                               FROM tmp_supplier_info
+                               WHERE wizard_id = %s AND id > %s
+                               ORDER BY id
+                               LIMIT %s""", (self.id, afterId, limit))
+        return self.env.cr.dictfetchall()
+
+    @api.model
+    def getProductsByBarcode(self, barcodes):
+        """
+            Map each barcode to the list of (product id, template id) using it
+        """
+        out = {}
+        productProductEnv = self.env['product.product']
+        for chunk in split_every(SEARCH_CHUNK_SIZE, barcodes):
+            products = productProductEnv.search([('barcode', 'in', list(chunk))])
+            for productDict in products.read(['barcode', 'product_tmpl_id'], load=False):
+                out.setdefault(productDict['barcode'], []).append((productDict['id'], productDict['product_tmpl_id']))
+        return out
+
+    @api.model
+    def getProductsByVendorCode(self, codes):
+        """
+            Map each vendor code to the product ids of the supplier infos using it
+        """
+        productIdsByCode = {}
+        supplierInfoObj = self.env['product.supplierinfo']
+        for chunk in split_every(SEARCH_CHUNK_SIZE, codes):
+            supplierInfos = supplierInfoObj.search([('product_code', 'in', list(chunk))])
+            for supplierInfoDict in supplierInfos.read(['product_code', 'product_id'], load=False):
+                productIdsByCode.setdefault(supplierInfoDict['product_code'], []).append(supplierInfoDict['product_id'])
+        templateIds = {}
+        productIds = set(productId for productIdList in productIdsByCode.values() for productId in productIdList if productId)
+        for productDict in self.env['product.product'].browse(list(productIds)).read(['product_tmpl_id'], load=False):
+            templateIds[productDict['id']] = productDict['product_tmpl_id']
+        out = {}
+        for code, productIdList in productIdsByCode.items():
+            out[code] = [(productId, templateIds.get(productId)) for productId in productIdList]
+        return out
+
+    @api.model
+    def getExistingSupplierInfos(self, partnerBrws, productIds):
+        """
+            Map each product id to the (price, date_start, date_end) of the partner supplier infos
+        """
+        out = {}
         supplierInfoObj = self.env['product.supplierinfo']
+        for chunk in split_every(SEARCH_CHUNK_SIZE, productIds):
+            supplierInfos = supplierInfoObj.search([('name', '=', partnerBrws.id),
+                                                    ('product_id', 'in', list(chunk))])
+            for supplierInfoDict in supplierInfos.read(['product_id', 'price', 'date_start', 'date_end'], load=False):
+                out.setdefault(supplierInfoDict['product_id'], []).append((supplierInfoDict['price'],
+                                                                           supplierInfoDict['date_start'],
+                                                                           supplierInfoDict['date_end']))
+        return out
+
+    @api.multi
+    def supplierInfoExists(self, existingSupplierInfos, productId, price, dateStart, precision):
+        if not dateStart or not self.data_decorrenza_pubblico:
+            return False
+        for supplierPrice, supplierDateStart, supplierDateEnd in existingSupplierInfos.get(productId, []):
+            if float_compare(supplierPrice, price, precision_digits=precision) != 0:
+                continue
+            if supplierDateStart and supplierDateStart < dateStart and supplierDateEnd and supplierDateEnd > self.data_decorrenza_pubblico:
+                return True
+        return False
+
+    @api.multi
+    def matchStagedLines(self, partner, stagedLines):
+        """
+            Return the values of the supplier infos to create for stagedLines, the errors found,
+            the fingerprints (product code -> fingerprint) of the lines related to a product
+            and the number of those lines
+        """
+        precision = self.env['decimal.precision'].precision_get('Product Price')
+        productsByBarcode = self.getProductsByBarcode(set(line['ean13'] for line in stagedLines if line['ean13']))
+        productsByCode = self.getProductsByVendorCode(set(line['codice_prodotto'] for line in stagedLines
+                                                          if line['codice_prodotto'] and line['ean13'] not in productsByBarcode))
+        productIds = set(productId for products in productsByBarcode.values() for productId, _templateId in products)
+        productIds.update(productId for products in productsByCode.values() for productId, _templateId in products if productId)
+        existingSupplierInfos = self.getExistingSupplierInfos(partner, list(productIds))
         
         errors = []
-        for lineBrws in self.supplier_infos:
-            products, tmperrors = self.getProducts(lineBrws)
-            if tmperrors:
-                errors.append(tmperrors)
-                continue
+        toCreate = []
+        fingerprints = {}
+        matched = 0
+        for line in stagedLines:
+            products = productsByBarcode.get(line['ean13'], []) if line['ean13'] else []
+            if not products and line['codice_prodotto']:
+                products = productsByCode.get(line['codice_prodotto'], [])
+                if len(products) > 1:
+                    errors.append('Product with default code %r has been coded more than once' % (line['codice_prodotto']))
+                    continue
 #             if not products:
-#                 raise UserError(_('Unable to find product with ID %r' % (lineBrws.id)))
-            for product in products:
-                if not self.checkSupplierInfoExists(lineBrws, partner, product):
+#                 raise UserError(_('Unable to find product with ID %r' % (line['id'])))
+            if any(productId for productId, _templateId in products):
+                matched += 1
+                if line['fingerprint'] and line['codice_prodotto']:
+                    fingerprints[line['codice_prodotto']] = line['fingerprint']
+            dateStart = fields.Date.to_string(line['data_ultima_variazione_var']) if line['data_ultima_variazione_var'] else False
+            price = line['prezzo_al_pubblico'] or 0.0
+            for productId, templateId in products:
+                if not productId:
+                    continue
+                if not self.supplierInfoExists(existingSupplierInfos, productId, price, dateStart, precision):
                     vals = {
                         'name': partner.id,
-                        'product_name': lineBrws.descrizione, # Vendor product name
-                        'product_code': lineBrws.codice_prodotto, # Vendor product Code
+                        'product_name': line['descrizione'] or False, # Vendor product name
+                        'product_code': line['codice_prodotto'] or False, # Vendor product Code
                         'discount': 0, # Discount (%)
-                        'delay': int(lineBrws.lead_time), # Delivery Lead Time
-                        'min_qty': lineBrws.qta_minima_ordine, # Minimal Quantity
-                        'price': lineBrws.prezzo_al_pubblico,
-                        'date_start': lineBrws.data_ultima_variazione_var,
+                        'delay': int(line['lead_time'] or 0), # Delivery Lead Time
+                        'min_qty': line['qta_minima_ordine'] or 0.0, # Minimal Quantity
+                        'price': price,
+                        'date_start': dateStart,
                         'date_end': self.data_decorrenza_pubblico,
-                        'product_tmpl_id': product.product_tmpl_id.id,
-                        'currency_id': lineBrws.codice_valuta.id,
-                        'product_id': product.id,
+                        'product_tmpl_id': templateId,
+                        'currency_id': line['codice_valuta'] or False,
+                        'product_id': productId,
                         }
-                    supplierInfoObj.create(vals)
+                    toCreate.append(vals)
+                    # Following lines of the same file must see this supplier info
+                    existingSupplierInfos.setdefault(productId, []).append((vals['price'], dateStart, self.data_decorrenza_pubblico))
+        return toCreate, errors, fingerprints, matched
+
+    @api.multi
+    def action_import(self):
+        partner = self.getPartner(self.partita_iva)
+        if not partner:
+            raise UserError(_('Unable to find related partner using VAT %r' % (self.partita_iva)))
+        
+        supplierInfoObj = self.env['product.supplierinfo']
+        toCreate, errors, fingerprints, _matched = self.matchStagedLines(partner, self.getStagedLines())
         if errors:
             msg = ''
             for err in errors:
                 msg = msg + err + '\n'
             raise UserError(msg)
-        
+        bulkInsert(supplierInfoObj, toCreate)
+        self.env['metel.import.fingerprint'].storeFingerprints(partner.id, fingerprints)
 
+    @api.multi
+    def action_queue_import(self):
+        """
+            Run check, staging and import of the file in background by the METEL import cron
+        """
+        if not self.fileData:
+            self.error_message = 'Cannot compute empty file'
+            return self.returnWizard()
+        self.deleteStagedLines()
+        self.write({'error_message': '',
+                    'import_state': 'queued',
+                    'import_offset': 0,
+                    'match_last_id': 0,
+                    'lines_parsed': 0,
+                    'lines_unchanged': 0,
+                    'lines_matched': 0,
+                    'lines_error': 0,
+                    'import_log': False})
+        return self.returnWizard()
 
-class TmpSupplierPricelist(models.TransientModel):
+    @api.multi
+    def action_resume_import(self):
+        """
+            Restart a failed background import from the last committed chunk
+        """
+        self.write({'error_message': '',
+                    'import_state': 'queued'})
+        return self.returnWizard()
+
+    @api.multi
+    def deleteStagedLines(self):
+        self.env.cr.execute("DELETE FROM tmp_supplier_info WHERE wizard_id IN %s", (tuple(self.ids),))
+        self.invalidate_cache(['supplier_infos'], self.ids)
+
+    @api.model
+    def runQueuedImports(self):
+        """
+            Called by the METEL import cron
+        """
+        self.vacuumImports()
+        for wizardBrws in self.search([('import_state', 'in', ['queued', 'parsing', 'matching'])], order='id'):
+            try:
+                wizardBrws.runBackgroundImport()
+            except Exception as ex:
+                logging.exception("METEL background import %r failed" % (wizardBrws.id))
+                self.env.cr.rollback()
+                wizardBrws.invalidate_cache()
+                wizardBrws.write({'import_state': 'failed',
+                                  'error_message': '%s' % (ex)})
+                self.env.cr.commit()
+
+    @api.model
+    def vacuumImports(self):
+        """
+            Delete the imports not running nor queued, and their staged lines, after IMPORT_RETENTION_DAYS
+        """
+        limitDate = datetime.datetime.utcnow() - datetime.timedelta(days=IMPORT_RETENTION_DAYS)
+        toDelete = self.search([('import_state', 'in', ['draft', 'done', 'failed']),
+                                ('write_date', '<', fields.Datetime.to_string(limitDate))])
+        if toDelete:
+            toDelete.unlink()
+            self.env.cr.commit()
+
+    @api.multi
+    def failBackgroundImport(self, message):
+        self.env.cr.rollback()
+        self.invalidate_cache()
+        self.deleteStagedLines()
+        self.write({'import_state': 'failed',
+                    'import_offset': 0,
+                    'match_last_id': 0,
+                    'lines_parsed': 0,
+                    'lines_unchanged': 0,
+                    'error_message': message})
+        self.env.cr.commit()
+
+    @api.multi
+    def runBackgroundImport(self):
+        """
+            Check, stage and import the file committing every chunk, so that a stopped
+            import continues from import_offset and match_last_id
+        """
+        self.ensure_one()
+        if self.import_state == 'queued':
+            self.import_state = 'parsing'
+            self.env.cr.commit()
+        if self.import_state == 'parsing':
+            with self.openMetelFile() as fileContent:
+                try:
+                    if not self.import_offset:
+                        self.import_offset = self.importHeader(fileContent)
+                        self.env.cr.commit()
+                    chunkBytes = IMPORT_CHUNK_BYTES
+                    processes = self.getParseProcesses()
+                    if processes > 1:
+                        # Chunks that a pre-parse is worth starting for, each process gets IMPORT_CHUNK_BYTES
+                        chunkBytes = max(IMPORT_CHUNK_BYTES * processes, PARALLEL_MIN_BYTES)
+                    while self.import_offset < len(fileContent):
+                        nextOffset = getChunkEnd(fileContent, self.import_offset, chunkBytes)
+                        counter, unchanged = self.stageRecords(fileContent, self.import_offset, nextOffset)
+                        self.write({'import_offset': nextOffset,
+                                    'lines_parsed': self.lines_parsed + counter,
+                                    'lines_unchanged': self.lines_unchanged + unchanged})
+                        self.env.cr.commit()
+                except MetelCheckError as ex:
+                    self.failBackgroundImport(ex.args[0])
+                    return
+            self.import_state = 'matching'
+            self.env.cr.commit()
+        if self.import_state == 'matching':
+            partner = self.getPartner(self.partita_iva)
+            if not partner:
+                self.write({'import_state': 'failed',
+                            'error_message': _('Unable to find related partner using VAT %r' % (self.partita_iva))})
+                self.env.cr.commit()
+                return
+            supplierInfoObj = self.env['product.supplierinfo']
+            while True:
+                stagedLines = self.getStagedLines(self.match_last_id, IMPORT_CHUNK_SIZE)
+                if not stagedLines:
+                    break
+                toCreate, errors, fingerprints, matched = self.matchStagedLines(partner, stagedLines)
+                bulkInsert(supplierInfoObj, toCreate)
+                self.env['metel.import.fingerprint'].storeFingerprints(partner.id, fingerprints)
+                values = {'match_last_id': stagedLines[-1]['id'],
+                          'lines_matched': self.lines_matched + matched,
+                          'lines_error': self.lines_error + len(errors)}
+                if errors:
+                    values['import_log'] = (self.import_log or '') + '\n'.join(errors) + '\n'
+                self.write(values)
+                self.env.cr.commit()
+            # Staged lines are not needed anymore, the counters are kept
+            self.deleteStagedLines()
+            self.import_state = 'done'
+            self.env.cr.commit()
+
+
+class TmpSupplierPricelist(models.Model):
     _name = 'tmp.supplier_info'
     
     prezzo_al_grossista = fields.Float(_('Wholesaler Price'))
@@ -435,6 +786,13 @@ class TmpSupplierPricelist(models.TransientModel):
     qta_in_cartone = fields.Float(_('Quantity in Cardboard'))
     unita_misura = fields.Many2one('product.uom', _('Unit of measure'))
     
-    wizard_id = fields.Many2one('tmp.supplier_info_wizard', string='ID')
+    fingerprint = fields.Char(_('Fingerprint'))
     
-    
\ No newline at end of file
+    wizard_id = fields.Many2one('tmp.supplier_info_wizard', string='ID', index=True, ondelete='cascade')
+
+    @api.model
+    def bulkCreate(self, valsList):
+        """
+            Insert staging rows with one query for each chunk, skipping the ORM create
+        """
+        bulkInsert(self, valsList)